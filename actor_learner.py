@@ -0,0 +1,146 @@
+import queue
+
+import torch
+import torch.multiprocessing as mp
+
+from profiling import BatchTimer
+from rollout_buffer import RolloutBuffer
+from utils import generate_episodes, seed_worker
+
+
+def _actor(index, model_args, shared_params, version, rollouts, stop, env, sampler):
+    '''
+    Rollout worker: repeatedly rolls out batch_size episodes with the latest published parameters and puts
+    them on the rollouts queue, together with the behaviour log-probs and the version of the parameters used.
+    Runs until stop is set.
+    index: number of the actor, seeds its random streams
+    '''
+    torch.set_num_threads(1)
+    # the learner stops reading before the queue is empty, do not wait for it to be flushed on exit
+    rollouts.cancel_join_thread()
+    seed_worker(model_args.seed, index)
+
+    policy = model_args.policy(model_args.state_input_size, model_args.action_space_size, model_args.hidden_size)
+    buffer = RolloutBuffer(model_args.batch_size, model_args.horizon)
+    seen = -1
+    while not stop.is_set():
+        with version.get_lock():
+            if version.value != seen:
+                policy.flat_params.copy_(shared_params)
+                seen = version.value
+
+        if sampler == None:
+            envs = [env.generate_fresh() for _ in range(model_args.batch_size)]
+        else:
+            envs = [sampler() for _ in range(model_args.batch_size)]
+        generate_episodes(policy, envs, model_args.horizon, False, buffer)
+
+        item = (seen, buffer.states.numpy().copy(), buffer.actions.numpy().copy(), buffer.rewards.numpy().copy(),
+                buffer.lengths.numpy().copy(), buffer.log_probs.numpy().copy())
+        while not stop.is_set():
+            try:
+                rollouts.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+class ActorLearner:
+    '''
+    Asynchronous actor-learner training of a REINFORCE model.
+
+    Actor processes roll out episodes with a snapshot of the policy parameters held in shared memory and push
+    them into a bounded queue, while the learner takes one batch at a time off the queue, updates the model and
+    publishes the new parameters. Rollouts therefore overlap with gradient computation instead of alternating
+    with it, at the cost of batches coming from a policy up to a few updates old. That lag is corrected for by
+    PPO's clipped importance ratio against the behaviour log-probs recorded by the actors, so the model must
+    use ppo.
+
+    Actors are forked, like ParallelReptile's workers, so env, sampler and model args need not be picklable,
+    and for the same reason as there their number is always given explicitly.
+    '''
+
+    def __init__(self, model, num_actors, queue_size=None):
+        '''
+        model: REINFORCE model to train, with args.ppo set
+        num_actors: number of rollout processes, e.g. os.cpu_count()
+        queue_size: most batches waiting for the learner, defaults to 2 per actor
+        '''
+        assert model.ppo, "asynchronous rollouts are off-policy, the importance correction needs ppo"
+        self.model = model
+        self.num_actors = num_actors
+        self.queue_size = queue_size if queue_size != None else 2 * self.num_actors
+
+        self.ctx = mp.get_context("fork")
+        self.params = model.get_flat_params().share_memory_()
+        self.version = self.ctx.Value("l", 0)
+
+    def publish(self):
+        '''
+        makes the model's current parameters the snapshot actors roll out with
+        '''
+        with self.version.get_lock():
+            self.params.copy_(self.model.policy.flat_params)
+            self.version.value += 1
+
+    def _next_batch(self, rollouts, actors):
+        while True:
+            try:
+                return rollouts.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in actors):
+                    raise RuntimeError("all rollout actors have exited")
+
+    def train(self, env, sampler=None):
+        '''
+        Same as REINFORCE.train, num_batches updates of batch_size trajectories each, but with the trajectories
+        collected by the actor processes.
+        The timings of the model's BatchTimer also record the policy lag of each batch, in updates.
+        '''
+        model = self.model
+        args = model.args
+        cumulative_rewards = []
+        losses = []
+        model.timer = BatchTimer(model.profile, model.timings_path)
+        model.timings = model.timer.records
+
+        self.publish()
+        rollouts = self.ctx.Queue(self.queue_size)
+        stop = self.ctx.Event()
+        actors = [self.ctx.Process(target=_actor, args=(i, args, self.params, self.version, rollouts, stop, env, sampler),
+                                   daemon=True)
+                  for i in range(self.num_actors)]
+        for p in actors:
+            p.start()
+
+        buffer = RolloutBuffer(args.batch_size, args.horizon)
+        try:
+            for batch in range(args.num_batches):
+                model.timer.start_batch(batch)
+
+                with model.timer.section("queue_wait"):
+                    version, states, actions, rewards, lengths, log_probs = self._next_batch(rollouts, actors)
+                    buffer.allocate(states.shape[2:], actions.shape[2:])
+                    buffer.states.copy_(torch.from_numpy(states))
+                    buffer.actions.copy_(torch.from_numpy(actions))
+                    buffer.rewards.copy_(torch.from_numpy(rewards))
+                    buffer.lengths.copy_(torch.from_numpy(lengths))
+                    buffer.log_probs.copy_(torch.from_numpy(log_probs))
+                cumulative_rewards.append(buffer.rewards.sum().item()/args.batch_size)
+                lag = self.version.value - version
+
+                model.fill_advantages(buffer)
+                model.update(buffer, batch, losses)
+                self.publish()
+
+                model.timer.end_batch(steps=len(buffer), reward=cumulative_rewards[-1], lag=lag)
+
+                if batch % 10 == 0:
+                    print(cumulative_rewards[-1])
+        finally:
+            stop.set()
+            for p in actors:
+                p.join()
+            rollouts.close()
+
+        return cumulative_rewards, losses
@@ -0,0 +1,9 @@
+'''
+Performance benchmarks for the simulators, rollouts and training loops.
+
+Run from the repository root with
+
+    python -m benchmarks [--quick] [--output results.json]
+
+Every benchmark reports its numbers as JSON so runs can be compared across commits.
+'''
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import numpy as np
+import torch
+
+from benchmarks import acting, envs, rollouts, training
+
+SUITES = {"envs": envs, "rollouts": rollouts, "training": training, "acting": acting}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the simulators, rollouts and training loops.")
+    parser.add_argument("--quick", action="store_true", help="short runs, for checking that the benchmarks work")
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITES), help="suites to run (default: all)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {"commit": git_commit(),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "torch": torch.__version__,
+              "num_threads": torch.get_num_threads(),
+              "quick": args.quick,
+              "results": {}}
+    for name in args.only or sorted(SUITES):
+        print("running " + name, file=sys.stderr)
+        report["results"][name] = SUITES[name].run(quick=args.quick)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output != None:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
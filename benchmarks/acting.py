@@ -0,0 +1,65 @@
+import torch
+
+from utils import ActorSmall, ActorIndex, ActorContinuous, ActorCNN, act, eval_mode
+from policy_export import export_acting
+from numpy_policy import LAYERS, NumpyActor
+from benchmarks.common import measure, sample_gobble, sample_maze
+
+HIDDEN_SIZE = 100
+BATCH_SIZES = [1, 64]
+
+
+def example_states(name, batch_size):
+    '''
+    ret: policy, a batch of batch_size states it acts on
+    '''
+    if name == "ActorSmall":
+        env = sample_gobble()
+        return ActorSmall(env.state_size, env.num_actions, HIDDEN_SIZE), torch.rand(batch_size, env.state_size)
+    if name == "ActorIndex":
+        env = sample_maze("index")
+        cells = torch.randint(0, env.num_row * env.num_col, (batch_size, 1)).float()
+        states = torch.cat([cells, torch.randint(0, 2, (batch_size, 4)).float()], dim=1)
+        return ActorIndex(env.input_size, env.num_actions, HIDDEN_SIZE), states
+    if name == "ActorCNN":
+        env = sample_gobble()
+        return ActorCNN(env.state_size, env.num_actions, HIDDEN_SIZE), torch.rand(batch_size, 2, env.rows, env.cols)
+    if name == "ActorContinuous":
+        return ActorContinuous(35, 2, HIDDEN_SIZE), torch.rand(batch_size, 35)
+
+
+def microseconds_per_step(fn, states, min_time):
+    def run():
+        with torch.inference_mode():
+            for _ in range(100):
+                fn(states)
+
+    return measure(run, min_time) / 100 * 1e6
+
+
+def run(quick=False):
+    '''
+    latency of one acting forward pass (sample actions, log-probs, values) per actor and batch size:
+    utils.act with the eager distribution classes against the exported acting functions and the NumPy engine
+    '''
+    min_time = 0.2 if quick else 1.0
+    # compiling takes tens of seconds per function, so quick runs leave it out
+    modes = ["eager", "trace"] if quick else ["eager", "trace", "compile"]
+    results = {}
+    for name in ["ActorSmall", "ActorIndex", "ActorCNN", "ActorContinuous"]:
+        r = {}
+        for batch_size in BATCH_SIZES:
+            policy, states = example_states(name, batch_size)
+            suffix = "/n=" + str(batch_size)
+            with eval_mode(policy):
+                r["act" + suffix] = microseconds_per_step(lambda s: act(policy, s), states, min_time)
+                for mode in modes:
+                    fn, used = export_acting(policy, states, mode)
+                    if used == mode:
+                        r[mode + suffix] = microseconds_per_step(fn, states, min_time)
+            if name in LAYERS:
+                state = {k: v.detach().numpy() for k, v in policy.state_dict().items()}
+                engine = NumpyActor(name, state)
+                r["numpy" + suffix] = microseconds_per_step(engine, states.numpy(), min_time)
+        results[name] = {"microseconds_per_step": r}
+    return results
@@ -0,0 +1,141 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import time
+from random import randint
+
+from sim import MazeArgs, Gobble, NoGobble, SideScroller, RockOn, MazeSimulator
+import maze_gen
+from utils import ActorSmall
+
+
+# envs the benchmarks cannot time yet, and why; reported in place of a number
+UNSUPPORTED = {"Continuous2D": "Continuous2D.get_state returns None, so every step looks terminal"}
+
+
+def measure(fn, min_time=1.0, min_reps=3):
+    '''
+    calls fn until at least min_time seconds and min_reps calls have passed
+    ret: seconds per call
+    '''
+    reps = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        reps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time and reps >= min_reps:
+            return elapsed / reps
+
+
+def in_fresh_process(module, function, *args):
+    '''
+    Calls module.function(*args) in a new interpreter. For measurements that fork worker processes, which can
+    hang when forked from a process that has already run torch (as the benchmark process has by then).
+    ret: the float the function returns
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import " + module + "; print(" + module + "." + function + "(*" + repr(args) + "))"
+    return float(subprocess.check_output([sys.executable, "-c", code], cwd=root).split()[-1])
+
+
+@contextlib.contextmanager
+def quiet():
+    '''
+    swallows the progress prints of REINFORCE.train so they do not end up in the JSON output
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def sample_gobble():
+    args = MazeArgs()
+    args.rows = 6
+    args.cols = 6
+    args.targets = [[randint(0, args.rows-1), randint(0, args.cols-1)] for i in range(randint(1, 2))]
+    return Gobble(args)
+
+
+def sample_no_gobble():
+    args = MazeArgs()
+    args.rows = 6
+    args.cols = 6
+    args.targets = [[randint(0, args.rows-1), randint(0, args.cols-1)] for i in range(randint(1, 2))]
+    return NoGobble(args)
+
+
+def sample_scroller():
+    args = MazeArgs()
+    args.rows = 6
+    args.cols = 6
+    args.blockers = []
+    for i in range(0, 2):
+        x_loc = randint(1, args.cols - 2)
+        wall_type = randint(0, 3)
+        if wall_type == 0:
+            args.blockers.append([x_loc, args.rows - 1])
+            args.blockers.append([x_loc, args.rows - 2])
+        elif wall_type == 1:
+            args.blockers.append([x_loc, args.rows - 1])
+        elif wall_type == 2:
+            args.blockers.append([x_loc, args.rows - 2])
+    return SideScroller(args)
+
+
+def sample_rock():
+    args = MazeArgs()
+    args.rows = 6
+    args.cols = 6
+    args.num_rocks = 2
+    return RockOn(args)
+
+
+def sample_maze(state_rep="fullboard"):
+    return MazeSimulator(randint(1, 7), randint(1, 14), "distance", state_rep)
+
+
+def sample_generated_maze(rows, cols, kind="backtracker", state_rep="index", seed=0):
+    '''
+    maze_gen layout with the goal on a random open square
+    '''
+    grid = maze_gen.generate(kind, rows, cols, seed)
+    squares = maze_gen.open_squares(grid)
+    goal_x, goal_y = squares[randint(1, len(squares) - 1)]
+    return MazeSimulator(int(goal_x), int(goal_y), "distance", state_rep, grid)
+
+
+def sample_task():
+    return [sample_gobble, sample_no_gobble, sample_scroller][randint(0, 2)]()
+
+
+class ModelArgs():
+    '''
+    the training configuration used in the notebooks
+    '''
+    def __init__(self, world):
+        # type of model related arguments
+        self.seed = 1
+        self.state_input_size = getattr(world, "input_size", world.state_size)
+        self.action_space_size = world.num_actions
+        self.lr = 3e-4
+        self.ppo = True
+        self.ppo_base_epsilon = 0.2
+        self.ppo_dec_epsilon = 0.0
+        self.use_critic = True
+        self.use_entropy = False
+
+        # training related arguments
+        self.gradient_clipping = True
+        self.random_perm = True
+        self.num_batches = 300
+        self.num_mini_batches = 1
+        self.batch_size = 5
+        self.horizon = 100
+        self.weight_func = lambda batch_num: (1 - batch_num/self.num_batches)**2
+
+        # policy
+        self.policy = ActorSmall
+        self.log_goal_locs = False
+        self.hidden_size = 100
@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import torch
+from random import randint
+
+from sim import MazeArgs, Discrete2D
+from vector_sim import make_vector_env
+from benchmarks.common import UNSUPPORTED, measure, sample_gobble, sample_no_gobble, sample_scroller, sample_rock, sample_maze, \
+    sample_generated_maze
+
+
+def sample_discrete():
+    args = MazeArgs()
+    args.rows = 10
+    args.cols = 10
+    args.agent = [0, 0]
+    args.goal = [randint(1, 9), randint(1, 9)]
+    return Discrete2D(args)
+
+
+def discrete_actions(n):
+    return [torch.tensor(randint(0, 3)) for _ in range(n)]
+
+
+# name: (sampler, action generator)
+ENVS = {"Discrete2D": (sample_discrete, discrete_actions),
+        "SideScroller": (sample_scroller, discrete_actions),
+        "Gobble": (sample_gobble, discrete_actions),
+        "NoGobble": (sample_no_gobble, discrete_actions),
+        "RockOn": (sample_rock, discrete_actions),
+        "MazeSimulator/xy": (lambda: sample_maze("xy"), discrete_actions),
+        "MazeSimulator/onehot": (lambda: sample_maze("onehot"), discrete_actions),
+        "MazeSimulator/fullboard": (lambda: sample_maze("fullboard"), discrete_actions),
+        "MazeSimulator/index": (lambda: sample_maze("index"), discrete_actions),
+        "MazeSimulator/index/backtracker-64x64": (lambda: sample_generated_maze(64, 64), discrete_actions),
+        "MazeSimulator/index/backtracker-256x256": (lambda: sample_generated_maze(256, 256), discrete_actions)}
+
+VECTOR_ENVS = {"Gobble": sample_gobble,
+               "NoGobble": sample_no_gobble,
+               "SideScroller": sample_scroller,
+               "RockOn": sample_rock,
+               "MazeSimulator/fullboard": lambda: sample_maze("fullboard"),
+               "MazeSimulator/index/backtracker-64x64": lambda: sample_generated_maze(64, 64)}
+
+
+def env_steps_per_sec(sampler, make_actions, num_steps, min_time):
+    '''
+    steps one environment num_steps times with random actions, starting a fresh copy whenever it terminates
+    '''
+    env = sampler()
+    actions = make_actions(num_steps)
+
+    def run():
+        e = env.generate_fresh()
+        for a in actions:
+            state, _ = e.step(a)
+            if state is None:
+                e = e.generate_fresh()
+
+    return num_steps / measure(run, min_time)
+
+
+def vector_env_steps_per_sec(sampler, num_envs, num_steps, min_time):
+    '''
+    steps a VectorEnv of num_envs instances num_steps times, resetting it once every instance is done
+    ret: environment steps (instances x calls) per second
+    '''
+    env = make_vector_env([sampler() for _ in range(num_envs)])
+    actions = np.random.randint(0, 4, size=(num_steps, num_envs))
+
+    def run():
+        env.reset()
+        for a in actions:
+            _, _, dones = env.step(a)
+            if dones.all():
+                env.reset()
+
+    return num_envs * num_steps / measure(run, min_time)
+
+
+# modules a fresh rollout worker imports, cold-start import time is measured in a new interpreter each
+IMPORT_MODULES = ["sim", "vector_sim", "utils"]
+
+
+def import_seconds(module, reps):
+    '''
+    ret: wall-clock seconds of `import module` in a fresh interpreter, the fastest of reps runs
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import time; t = time.perf_counter(); import " + module + "; print(time.perf_counter() - t)"
+    return min(float(subprocess.check_output([sys.executable, "-c", code], cwd=root)) for _ in range(reps))
+
+
+def run(quick=False):
+    num_steps = 200 if quick else 2000
+    min_time = 0.2 if quick else 1.0
+    results = {}
+    for name, (sampler, make_actions) in ENVS.items():
+        results[name] = {"steps_per_sec": env_steps_per_sec(sampler, make_actions, num_steps, min_time)}
+    results["Continuous2D"] = {"unsupported": UNSUPPORTED["Continuous2D"]}
+    for name, sampler in VECTOR_ENVS.items():
+        for num_envs in [8, 64]:
+            key = "Vector" + name + "/n=" + str(num_envs)
+            results[key] = {"steps_per_sec": vector_env_steps_per_sec(sampler, num_envs, num_steps // 10, min_time)}
+    for module in IMPORT_MODULES:
+        results["import " + module] = {"seconds": import_seconds(module, 1 if quick else 5)}
+    return results
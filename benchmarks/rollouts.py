@@ -0,0 +1,47 @@
+from utils import ActorSmall, ActorIndex, ActorCNN, generate_episode, generate_episodes
+from benchmarks.common import UNSUPPORTED, measure, sample_gobble, sample_maze
+
+HIDDEN_SIZE = 100
+HORIZON = 100
+
+# name: (actor class, env sampler)
+ACTORS = {"ActorSmall/Gobble": (ActorSmall, sample_gobble),
+          "ActorSmall/MazeSimulator": (ActorSmall, sample_maze),
+          "ActorIndex/MazeSimulator": (ActorIndex, lambda: sample_maze("index")),
+          "ActorCNN/Gobble": (ActorCNN, sample_gobble)}
+
+
+def rollouts_per_sec(actor, sampler, min_time):
+    env = sampler()
+    policy = actor(getattr(env, "input_size", env.state_size), env.num_actions, HIDDEN_SIZE)
+
+    def run():
+        generate_episode(policy, env.generate_fresh(), HORIZON)
+
+    return 1 / measure(run, min_time)
+
+
+def batched_rollouts_per_sec(actor, sampler, batch_size, min_time):
+    env = sampler()
+    policy = actor(getattr(env, "input_size", env.state_size), env.num_actions, HIDDEN_SIZE)
+
+    def run():
+        generate_episodes(policy, [env.generate_fresh() for _ in range(batch_size)], HORIZON)
+
+    return batch_size / measure(run, min_time)
+
+
+def run(quick=False):
+    min_time = 0.2 if quick else 1.0
+    results = {}
+    for name, (actor, sampler) in ACTORS.items():
+        try:
+            r = {"generate_episode": rollouts_per_sec(actor, sampler, min_time)}
+            for batch_size in [5, 64]:
+                r["generate_episodes/n=" + str(batch_size)] = batched_rollouts_per_sec(actor, sampler, batch_size, min_time)
+            results[name] = {"rollouts_per_sec": r}
+        except Exception as e:
+            # some actor/env pairings cannot be rolled out yet, record why instead of dropping them
+            results[name] = {"error": type(e).__name__ + ": " + str(e)}
+    results["ActorContinuous/Continuous2D"] = {"unsupported": UNSUPPORTED["Continuous2D"]}
+    return results
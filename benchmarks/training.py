@@ -0,0 +1,107 @@
+import copy
+import os
+from collections import OrderedDict
+
+from reinforce import REINFORCE
+from reptile import Reptile, ParallelReptile
+from actor_learner import ActorLearner
+from utils_training import update_init_params
+from benchmarks.common import in_fresh_process, measure, quiet, sample_gobble, sample_task, ModelArgs
+
+# REPTILE settings of the game notebook
+NUM_TASKS = 10
+K = 4
+ALPHA = 0.1
+
+
+def seconds_per_batch(ppo, num_batches, min_time):
+    model_args = ModelArgs(sample_gobble())
+    model_args.ppo = ppo
+    model_args.num_batches = num_batches
+    model = REINFORCE(model_args)
+
+    def run():
+        with quiet():
+            model.train(None, sample_task)
+
+    return measure(run, min_time) / num_batches
+
+
+def seconds_per_async_batch(num_batches, min_time):
+    '''
+    ActorLearner with one actor per core, including starting the actors. Forks, so run it with in_fresh_process
+    '''
+    model_args = ModelArgs(sample_gobble())
+    model_args.num_batches = num_batches
+    learner = ActorLearner(REINFORCE(model_args), os.cpu_count())
+
+    def run():
+        with quiet():
+            learner.train(None, sample_task)
+
+    return measure(run, min_time) / num_batches
+
+
+def seconds_per_meta_iteration(num_tasks, min_time):
+    '''
+    the sequential REPTILE loop of the notebooks
+    '''
+    model_args = ModelArgs(sample_gobble())
+    model_args.num_batches = K
+    model = REINFORCE(model_args)
+
+    def run():
+        tasks = [sample_task() for _ in range(num_tasks)]
+        init_params = copy.deepcopy(OrderedDict(model.policy.named_parameters()))
+        temp_params = copy.deepcopy(OrderedDict(model.policy.named_parameters()))
+        with quiet():
+            for t in tasks:
+                model.policy.load_state_dict(init_params)
+                model.init_optimizers()
+                model.train(t)
+                target_policy = OrderedDict(model.policy.named_parameters())
+                temp_params = update_init_params(target_policy, temp_params, ALPHA/K)
+        model.policy.load_state_dict(temp_params)
+
+    return measure(run, min_time, min_reps=1)
+
+
+def seconds_per_flat_meta_iteration(num_tasks, min_time):
+    model_args = ModelArgs(sample_gobble())
+    model_args.num_batches = K
+    reptile = Reptile(REINFORCE(model_args), ALPHA/K)
+
+    def run():
+        with quiet():
+            reptile.meta_step([sample_task() for _ in range(num_tasks)])
+
+    return measure(run, min_time, min_reps=1)
+
+
+def seconds_per_parallel_meta_iteration(num_tasks, min_time):
+    '''
+    ParallelReptile with one worker per core. Forks, so run it with in_fresh_process
+    '''
+    model_args = ModelArgs(sample_gobble())
+    model_args.num_batches = K
+    model = REINFORCE(model_args)
+
+    # workers are forked inside quiet() so their prints are swallowed too
+    with quiet(), ParallelReptile(model, ALPHA/K, os.cpu_count()) as reptile:
+        def run():
+            reptile.meta_step([sample_task() for _ in range(num_tasks)])
+        return measure(run, min_time, min_reps=1)
+
+
+def run(quick=False):
+    min_time = 0.5 if quick else 3.0
+    num_tasks = 2 if quick else NUM_TASKS
+    return {"REINFORCE.train": {"seconds_per_batch/ppo": seconds_per_batch(True, 2 if quick else 10, min_time),
+                                "seconds_per_batch/no_ppo": seconds_per_batch(False, 2 if quick else 10, min_time)},
+            "ActorLearner.train": {"seconds_per_batch": in_fresh_process("benchmarks.training", "seconds_per_async_batch",
+                                                                         2 if quick else 10, min_time)},
+            "REPTILE": {"num_tasks": num_tasks,
+                        "seconds_per_meta_iteration": seconds_per_meta_iteration(num_tasks, min_time),
+                        "seconds_per_meta_iteration/flat": seconds_per_flat_meta_iteration(num_tasks, min_time),
+                        "seconds_per_meta_iteration/parallel": in_fresh_process(
+                            "benchmarks.training", "seconds_per_parallel_meta_iteration", num_tasks, min_time)}}
@@ -0,0 +1,143 @@
+'''
+Maze layouts for MazeSimulator as (rows, cols) bool arrays indexed [y, x], True where there is a wall.
+Every layout is surrounded by walls and keeps the start square (1, 1) open.
+
+Generators take a seed (anything np.random.default_rng accepts) so that a layout can be reproduced.
+'''
+import numpy as np
+
+# x, y offsets between neighbouring cells of the backtracker and Prim's lattices
+_CELL_MOVES = [(0, -2), (0, 2), (2, 0), (-2, 0)]
+
+
+def open_room(rows, cols):
+    '''
+    ret: a single room, walls only around the border (the original MazeSimulator layout)
+    '''
+    grid = np.ones((rows, cols), dtype=bool)
+    grid[1:-1, 1:-1] = False
+    return grid
+
+
+def random_walls(rows, cols, density=0.2, seed=None):
+    '''
+    open room with each inner square independently made a wall with probability density,
+    the result need not be connected
+    '''
+    rng = np.random.default_rng(seed)
+    grid = open_room(rows, cols)
+    grid[1:-1, 1:-1] = rng.random((rows - 2, cols - 2)) < density
+    grid[1, 1] = False
+    return grid
+
+
+def _in_lattice(grid, x, y):
+    return 0 < x < grid.shape[1] - 1 and 0 < y < grid.shape[0] - 1
+
+
+def recursive_backtracker(rows, cols, seed=None):
+    '''
+    perfect maze (exactly one path between any two open squares) carved by a randomized depth first search,
+    which gives long winding corridors. Open squares sit on odd coordinates, so with an even number of
+    rows or cols the last inner row/col stays wall.
+    '''
+    rng = np.random.default_rng(seed)
+    grid = np.ones((rows, cols), dtype=bool)
+    grid[1, 1] = False
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack[-1]
+        options = [(x + dx, y + dy) for dx, dy in _CELL_MOVES
+                   if _in_lattice(grid, x + dx, y + dy) and grid[y + dy, x + dx]]
+        if len(options) == 0:
+            stack.pop()
+            continue
+        nx, ny = options[rng.integers(len(options))]
+        grid[(y + ny) // 2, (x + nx) // 2] = False
+        grid[ny, nx] = False
+        stack.append((nx, ny))
+    return grid
+
+
+def prims(rows, cols, seed=None):
+    '''
+    perfect maze grown by randomized Prim's algorithm, which gives many short dead ends.
+    Uses the same odd coordinate lattice as recursive_backtracker.
+    '''
+    rng = np.random.default_rng(seed)
+    grid = np.ones((rows, cols), dtype=bool)
+    grid[1, 1] = False
+
+    # passages from an open cell (x, y) to a closed cell (nx, ny)
+    frontier = [(1, 1, 1 + dx, 1 + dy) for dx, dy in _CELL_MOVES if _in_lattice(grid, 1 + dx, 1 + dy)]
+    while frontier:
+        # swap a random entry to the end so removal is O(1)
+        i = rng.integers(len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]
+        x, y, nx, ny = frontier.pop()
+        if not grid[ny, nx]:
+            continue
+        grid[(y + ny) // 2, (x + nx) // 2] = False
+        grid[ny, nx] = False
+        frontier.extend((nx, ny, nx + dx, ny + dy) for dx, dy in _CELL_MOVES
+                        if _in_lattice(grid, nx + dx, ny + dy) and grid[ny + dy, nx + dx])
+    return grid
+
+
+GENERATORS = {"open": lambda rows, cols, seed=None: open_room(rows, cols),
+              "random": random_walls,
+              "backtracker": recursive_backtracker,
+              "prims": prims}
+
+
+def generate(kind, rows, cols, seed=None):
+    '''
+    kind: one of GENERATORS
+    ret: (rows, cols) bool wall grid
+    '''
+    if kind not in GENERATORS:
+        raise ValueError("unknown maze generator " + repr(kind) + ", expected one of " + str(list(GENERATORS)))
+    return GENERATORS[kind](rows, cols, seed=seed)
+
+
+def open_squares(grid):
+    '''
+    ret: (n, 2) int array of the x, y coordinates of every open square, e.g. to sample goals from
+    '''
+    ys, xs = np.nonzero(~grid)
+    return np.stack([xs, ys], axis=1)
+
+
+def distance_field(grid, goal_x, goal_y):
+    '''
+    shortest path lengths to (goal_x, goal_y) moving N/S/E/W between open squares, from one breadth first search
+    ret: (rows, cols) int array of steps to the goal, -1 for walls and squares the goal cannot be reached from
+    '''
+    rows, cols = grid.shape
+    is_open = (~grid).ravel().tolist()
+    dist = [-1] * (rows * cols)
+    goal = goal_y * cols + goal_x
+    dist[goal] = 0
+
+    # the border is all walls, so flat index offsets never wrap around to another row
+    offsets = (-cols, cols, 1, -1)
+    frontier = [goal]
+    d = 0
+    while frontier:
+        d += 1
+        next_frontier = []
+        for c in frontier:
+            for o in offsets:
+                n = c + o
+                if is_open[n] and dist[n] < 0:
+                    dist[n] = d
+                    next_frontier.append(n)
+        frontier = next_frontier
+    return np.array(dist, dtype=np.int64).reshape(rows, cols)
+
+
+def to_rows(grid):
+    '''
+    ret: the layout in MazeSimulator's list of lists form, "W" for walls and " " for open squares
+    '''
+    return [["W" if w else " " for w in row] for row in grid.tolist()]
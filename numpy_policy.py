@@ -0,0 +1,144 @@
+'''
+NumPy-only inference for trained actors, for serving processes that only act and should not import torch.
+
+save_npz writes an actor's weights to a flat .npz (run it wherever the model was trained), and load_npz
+rebuilds the actor's forward pass, value head and action sampling from that file with NumPy alone.
+Supported actors are ActorSmall, ActorIndex and ActorContinuous.
+'''
+import math
+
+import numpy as np
+
+# actor class name -> layers the engine needs from its state_dict
+LAYERS = {"ActorSmall": ["fc1_a", "fc2_a", "fc3_a", "fc4_a", "fc6_a", "fc6_c"],
+          "ActorIndex": ["fc1_a", "fc2_a", "fc3_a", "fc4_a", "fc6_a", "fc6_c"],
+          "ActorContinuous": ["fc1_a", "fc2_a", "fc3_a", "fc4_a", "means", "scale", "fc6_c"]}
+
+LOG_SCALE_MIN = math.log(1e-6)
+LOG_SCALE_MAX = math.log(10)
+
+
+def save_npz(policy, path):
+    '''
+    policy: ActorSmall, ActorIndex or ActorContinuous, or a REINFORCE model holding one
+    path: .npz file to write, holding the actor's class name and each layer's weight and bias
+    '''
+    policy = getattr(policy, "policy", policy)
+    kind = type(policy).__name__
+    if kind not in LAYERS:
+        raise ValueError("no NumPy engine for " + kind + ", expected one of " + str(list(LAYERS)))
+    state = policy.state_dict()
+    arrays = {}
+    for layer in LAYERS[kind]:
+        for p in ("weight", "bias"):
+            arrays[layer + "." + p] = state[layer + "." + p].detach().cpu().numpy().astype(np.float32)
+    np.savez(path, kind=np.array(kind), **arrays)
+
+
+def load_npz(path):
+    '''
+    ret: NumpyActor with the weights saved by save_npz
+    '''
+    with np.load(path) as f:
+        kind = str(f["kind"])
+        params = {k: f[k] for k in f.files if k != "kind"}
+    return NumpyActor(kind, params)
+
+
+class NumpyActor:
+    '''
+    Forward pass of an exported actor in NumPy, batched over any leading dimensions of the states.
+    Outputs match the torch actor's to float32 rounding; sampling uses a numpy Generator, so sampled actions
+    follow the same distribution as the torch actor's but not its random stream.
+    '''
+
+    def __init__(self, kind, params, seed=None):
+        '''
+        kind: class name of the exported actor
+        params: dict of "<layer>.weight" / "<layer>.bias" arrays, as in the actor's state_dict
+        seed: seed of the sampling stream
+        '''
+        self.kind = kind
+        self.layers = {layer: (params[layer + ".weight"], params[layer + ".bias"]) for layer in LAYERS[kind]}
+        self.continuous = kind == "ActorContinuous"
+        self.input_size = self.layers["fc1_a"][0].shape[1]
+        self.hidden_size = self.layers["fc1_a"][0].shape[0]
+        self.action_space_size = self.layers["means" if self.continuous else "fc6_a"][0].shape[0]
+        self.rng = np.random.default_rng(seed)
+
+    def linear(self, layer, x):
+        weight, bias = self.layers[layer]
+        return x @ weight.T + bias
+
+    def input_layer(self, x):
+        if self.kind == "ActorIndex":
+            # [cell index, wall bits]: the cell's column of the fullboard weight, as in ActorIndex.input_layer
+            weight, bias = self.layers["fc1_a"]
+            return weight.T[x[..., 0].astype(np.int64)] + x[..., 1:] @ weight[:, -4:].T + bias
+        return self.linear("fc1_a", x)
+
+    def features(self, x):
+        '''
+        x: states, (..., state_size)
+        return: hidden features shared by the policy and value heads
+        '''
+        x = np.maximum(self.input_layer(np.asarray(x, dtype=np.float32)), 0)
+        for layer in ("fc2_a", "fc3_a", "fc4_a"):
+            x = np.maximum(self.linear(layer, x), 0)
+        return x
+
+    def distribution(self, h):
+        '''
+        h: hidden features from features()
+        return: log-probabilities of every action (discrete actors), or the Normal's mean and log-scale
+        '''
+        if self.continuous:
+            mean = np.clip(self.linear("means", h), -1, 1)
+            log_scale = np.clip(self.linear("scale", h), LOG_SCALE_MIN, LOG_SCALE_MAX)
+            return mean, log_scale
+        logits = self.linear("fc6_a", h)
+        logits = logits - logits.max(-1, keepdims=True)
+        return logits - np.log(np.exp(logits).sum(-1, keepdims=True))
+
+    def value(self, x):
+        return self.linear("fc6_c", self.features(x))
+
+    def log_prob(self, x, action):
+        '''
+        ret: log-probabilities of the given actions in states x, as policy(x).log_prob(action)
+        '''
+        dist = self.distribution(self.features(x))
+        if self.continuous:
+            mean, log_scale = dist
+            noise = (np.asarray(action, dtype=np.float32) - mean) / np.exp(log_scale)
+            return (-0.5 * noise**2 - log_scale - 0.5 * math.log(2 * math.pi)).sum(-1)
+        action = np.asarray(action, dtype=np.int64)
+        return np.take_along_axis(dist, action[..., None], -1)[..., 0]
+
+    def act(self, x, greedy=False):
+        '''
+        x: states, (..., state_size)
+        greedy: take the most likely action (the mean for ActorContinuous) instead of sampling
+        return: actions, their log-probabilities, value estimates
+        '''
+        h = self.features(x)
+        value = self.linear("fc6_c", h)[..., 0]
+        if self.continuous:
+            mean, log_scale = self.distribution(h)
+            noise = np.zeros_like(mean) if greedy else self.rng.standard_normal(mean.shape).astype(np.float32)
+            action = mean + np.exp(log_scale) * noise
+            log_prob = (-0.5 * noise**2 - log_scale - 0.5 * math.log(2 * math.pi)).sum(-1)
+            return action, log_prob, value
+
+        log_probs = self.distribution(h)
+        if greedy:
+            action = log_probs.argmax(-1)
+        else:
+            # inverse CDF sampling, clipped for rounding in the last cumulative probability
+            cdf = np.exp(log_probs).cumsum(-1)
+            u = self.rng.random(cdf.shape[:-1] + (1,)) * cdf[..., -1:]
+            action = np.minimum((cdf <= u).sum(-1), self.action_space_size - 1)
+        return action, np.take_along_axis(log_probs, action[..., None], -1)[..., 0], value
+
+    def __call__(self, x):
+        return self.act(x)
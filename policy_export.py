@@ -0,0 +1,120 @@
+'''
+Exported acting functions of the actors in utils: state batch -> (action, log-prob, value) as one module that
+TorchScript or torch.compile can optimize, since the per-step cost of the small policies is mostly Python
+dispatch. The same module serves for rollouts (see generate_episodes' acting argument) and for serving an
+adapted policy on CPU, saved with torch.jit.save.
+'''
+import math
+import warnings
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from utils import ActorContinuous, eval_mode
+
+MODES = ["trace", "compile", "eager"]
+
+
+class DiscreteActing(nn.Module):
+    '''
+    acting function of the actors with a softmax/Categorical head (ActorSmall, ActorIndex, ActorCNN)
+    '''
+
+    def __init__(self, policy):
+        super(DiscreteActing, self).__init__()
+        self.policy = policy
+
+    def forward(self, x):
+        '''
+        x: batch of states
+        return: sampled actions, their log-probabilities, value estimates, all of shape (batch,)
+        '''
+        h = self.policy.features(x)
+        log_probs = F.log_softmax(self.policy.fc6_a(h), dim=-1)
+        action = torch.multinomial(log_probs.exp(), 1)
+        return action.squeeze(-1), log_probs.gather(-1, action).squeeze(-1), self.policy.fc6_c(h).squeeze(-1)
+
+
+class ContinuousActing(nn.Module):
+    '''
+    acting function of ActorContinuous, the same Normal distribution written out in plain tensor ops
+    '''
+
+    def __init__(self, policy):
+        super(ContinuousActing, self).__init__()
+        self.policy = policy
+
+    def forward(self, x):
+        '''
+        x: batch of states
+        return: sampled actions (batch, action_size), their log-probabilities (batch,), value estimates (batch,)
+        '''
+        h = self.policy.features(x)
+        mean = torch.clamp(self.policy.means(h), -1, 1)
+        log_scale = torch.clamp(self.policy.scale(h), min=math.log(1e-6), max=math.log(10))
+        noise = torch.randn_like(mean)
+        action = mean + torch.exp(log_scale) * noise
+        log_prob = (-0.5 * noise**2 - log_scale - 0.5 * math.log(2 * math.pi)).sum(-1)
+        return action, log_prob, self.policy.fc6_c(h).squeeze(-1)
+
+
+def acting_module(policy):
+    '''
+    ret: the eager acting module of policy, it shares the policy's parameters
+    '''
+    if isinstance(policy, ActorContinuous):
+        return ContinuousActing(policy)
+    return DiscreteActing(policy)
+
+
+def export_acting(policy, example_state, mode="trace"):
+    '''
+    Builds the acting function of policy in the given mode, falling back to eager with a warning if that mode
+    is not available (e.g. torch.compile without a working compiler).
+    The result shares the policy's parameters, so in place updates (REINFORCE.set_flat_params, optimizer steps)
+    are seen by it. Traced and compiled functions run the policy as in eval mode.
+
+    example_state: batch of states of the shape the function will be called with, the batch size may vary
+    mode: "trace" (TorchScript, can be saved with torch.jit.save), "compile" (torch.compile) or "eager"
+    ret: acting function, the mode actually used
+    '''
+    if mode not in MODES:
+        raise ValueError("unknown acting mode " + repr(mode) + ", expected one of " + str(MODES))
+    module = acting_module(policy)
+    if mode == "eager":
+        return module, mode
+
+    try:
+        with eval_mode(policy), torch.inference_mode():
+            if mode == "trace":
+                # sampling makes repeated runs differ, which is all the trace check would compare
+                fn = torch.jit.trace(module, example_state, check_trace=False)
+            else:
+                fn = torch.compile(module, dynamic=True)
+            # compilation errors of torch.compile only surface on the first call
+            fn(example_state)
+        return fn, mode
+    except Exception as e:
+        warnings.warn("acting mode " + repr(mode) + " is not available, using eager: " + type(e).__name__ + ": " + str(e))
+        return module, "eager"
+
+
+class ExportedActing:
+    '''
+    Acting function for generate_episodes, exported on its first call with that call's states as the example.
+    '''
+
+    def __init__(self, policy, mode="trace"):
+        self.policy = policy
+        self.requested_mode = mode
+        self.mode = None
+        self.fn = None
+
+    def __call__(self, state):
+        '''
+        ret: actions, their log-probabilities, value estimates
+        '''
+        if self.fn == None:
+            self.fn, self.mode = export_acting(self.policy, state, self.requested_mode)
+        return self.fn(state)
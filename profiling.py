@@ -0,0 +1,59 @@
+import contextlib
+import json
+import time
+
+
+class _Section:
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        record = self.timer.current
+        record[self.name] = record.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class BatchTimer:
+    '''
+    Records the wall time spent in named sections of each training batch.
+
+    When disabled every call is a no-op, so the timer can stay in the training loop permanently.
+    Each finished batch is appended to records as a dict of seconds per section, and written as one
+    JSON line to path if a path is given.
+    '''
+
+    def __init__(self, enabled=False, path=None):
+        self.enabled = enabled
+        self.path = path
+        self.records = []
+        self.current = None
+        self._null = contextlib.nullcontext()
+
+    def start_batch(self, batch, **info):
+        if self.enabled:
+            self.current = {"batch": batch}
+            self.current.update(info)
+            self._batch_start = time.perf_counter()
+
+    def section(self, name):
+        '''
+        ret: context manager adding the time spent inside it to section name of the current batch
+        '''
+        if not self.enabled:
+            return self._null
+        return _Section(self, name)
+
+    def end_batch(self, **info):
+        if not self.enabled:
+            return
+        self.current.update(info)
+        self.current["total"] = time.perf_counter() - self._batch_start
+        self.records.append(self.current)
+        if self.path != None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(self.current) + "\n")
+        self.current = None
@@ -2,21 +2,17 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 import torch.optim as optim
 
-import numpy as np
-
-import matplotlib.pyplot as plt
 # from tqdm import tqdm
-from random import random
 
 from utils import *
+from returns import compute_advantages
+from rollout_buffer import RolloutBuffer
+from profiling import BatchTimer
+from policy_export import ExportedActing
 
-import torch.multiprocessing as mp
-import copy
 from collections import OrderedDict
-import math
 
 class REINFORCE(nn.Module):
 
@@ -36,43 +32,85 @@ class REINFORCE(nn.Module):
         self.ppo_dec_epsilon = args.ppo_dec_epsilon
         self.use_critic = args.use_critic
         self.use_entropy = args.use_entropy
+        self.gamma = getattr(args, "gamma", 0.9)
+        self.gae_lambda = getattr(args, "gae_lambda", None) # None for Monte Carlo advantages
+        self.num_epochs = getattr(args, "num_epochs", 1) # passes over each batch of rollouts
+        self.target_kl = getattr(args, "target_kl", None) # stop a batch's updates early once the approx KL exceeds this
+
+        # opt-in per-batch timings of train(), kept in self.timings and optionally appended to a JSONL file
+        self.profile = getattr(args, "profile", False)
+        self.timings_path = getattr(args, "timings_path", None)
+        self.timer = BatchTimer(self.profile, self.timings_path)
+        self.timings = self.timer.records
 
         self.policy = args.policy(self.state_input_size, self.action_space_size, args.hidden_size)
-        self.old_policy = args.policy(self.state_input_size, self.action_space_size, args.hidden_size)
         self.init_optimizers()
 
+        # rollouts sample with an exported acting function of the policy ("trace" or "compile") if set
+        self.acting_mode = getattr(args, "acting", None)
+        self.acting = ExportedActing(self.policy, self.acting_mode) if self.acting_mode != None else None
+
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        # models saved before PPO used the rollouts' log-probs also hold a copy of the policy as old_policy
+        state_dict = OrderedDict((k, v) for k, v in state_dict.items() if not k.startswith("old_policy."))
+        return super(REINFORCE, self).load_state_dict(state_dict, *args, **kwargs)
+
     def init_optimizers(self):
         self.opt_a = optim.Adam(self.policy.parameters(), lr=self.lr)
 
-    def compute_loss(self, state, action, weights, ppo_epsilon):
+    def reset_optimizer(self):
+        '''
+        same effect as init_optimizers(), but zeroes the existing Adam state in place instead of reallocating it
+        '''
+        for state in self.opt_a.state.values():
+            for v in state.values():
+                if torch.is_tensor(v):
+                    v.zero_()
+
+    def get_flat_params(self):
+        '''
+        ret: 1-D tensor holding a copy of all policy parameters
+        '''
+        return self.policy.flat_params.clone()
+
+    def set_flat_params(self, flat):
+        '''
+        copies a 1-D tensor from get_flat_params() into the policy parameters in place, so the parameter
+        tensors (and the optimizer state attached to them) are kept rather than replaced
         '''
+        with torch.no_grad():
+            self.policy.flat_params.copy_(flat)
+
+    def compute_loss(self, dist, action, weights, ppo_epsilon, old_log_prob=None):
+        '''
+        dist is the current policy's action distribution, from policy.forward_all
         weights is what to multiply the log probability by
+        old_log_prob is the log probability of action under the policy that sampled it, recorded at rollout time (PPO only)
         '''
+        log_prob = dist.log_prob(action)
         if self.ppo:
-            logp_ratios =  self.policy(state).log_prob(action) - self.old_policy(state).log_prob(action)
+            logp_ratios =  log_prob - old_log_prob
             ratios = torch.exp(logp_ratios)
             clipped_adv = torch.clamp(ratios, 1 - ppo_epsilon, 1 + ppo_epsilon) * weights
             non_clipped_adv = ratios * weights
 
-            return -(torch.min(clipped_adv, non_clipped_adv)).sum(), -self.policy(state).entropy().sum()
+            return -(torch.min(clipped_adv, non_clipped_adv)).sum(), -dist.entropy().sum()
         else:
-            ratios =  self.policy(state).log_prob(action)
-            loss = ratios * weights
-            return -(loss.sum()), -self.policy(state).entropy().sum()
+            loss = log_prob * weights
+            return -(loss.sum()), -dist.entropy().sum()
 
-    def compute_critic_loss(self, state, value):
+    def compute_critic_loss(self, predicted, value):
         '''
-        weights is what to multiply the log probability by
+        predicted is the critic's estimate from policy.forward_all, value is the target
         '''
-        loss = F.smooth_l1_loss(self.policy.value(state), value)
+        loss = F.smooth_l1_loss(predicted, value)
         return loss.sum()
     
     def normalize_advantages(self, advantages):
         '''
         instead scale advantages between 0 and 1?
         '''
-        advantages = np.array(advantages)
-        std = np.std(advantages)
+        std = advantages.std(unbiased=False)
         mean = advantages.mean()
         if std != 0:
             advantages = (advantages - mean) / (std)  
@@ -90,49 +128,109 @@ class REINFORCE(nn.Module):
             params[name] = param - step_size * grad
         return params
 
-    def __step(self, env, horizon):
+    def __step(self, envs, buffer):
         '''
-        makes horizon steps in this trajectory in this environment
+        makes up to buffer.horizon steps in a trajectory in each of the environments, all rolled out together
+        into buffer, and fills in the returns and advantages of every step
         '''
-        lam = 0.9
-
         # number of steps to take in this environment
-        if self.ppo:
-            S, A, R = generate_episode(self.old_policy, env, horizon, self.args.log_goal_locs)
-        else:
-            S, A, R = generate_episode(self.policy, env, horizon, self.args.log_goal_locs)
-
-        traj_len = len(A)
-
-        # compute advantage (of that action)
-        critic_target = [0]*traj_len
-        adv = [0]*traj_len
-        for t in range(traj_len):
-            k = traj_len-t
-            G = sum([R[t+i]*lam**(i) for i in range(0, k)])
-            if not self.use_critic:
-                adv[t] = G
-            else:
-                adv[t] = G - self.policy.value(S[t]).item()
-            critic_target[t] = G
-        
-        mini_batch_states = []
-        mini_batch_actions = []
-        mini_batch_td = []
-        mini_batch_adv = []
-        mini_batch_rewards = []
-        for t in range(traj_len):
-            mini_batch_states.append(S[t].data.numpy())
-            if A[t].dim() == 0:
-                mini_batch_actions.append(A[t])
-            else:
-                assert not np.isnan(list(A[0])[0].item()), "state " + str(S) + " reward " + str(R)
-                mini_batch_actions.append(list(A[t]))
-            mini_batch_td.append(critic_target[t])
-            mini_batch_adv.append(adv[t])
-            mini_batch_rewards.append(R[t])
+        with self.timer.section("rollout"):
+            generate_episodes(self.policy, envs, buffer.horizon, self.args.log_goal_locs, buffer, self.acting)
+        self.fill_advantages(buffer)
 
-        return env, mini_batch_states, mini_batch_actions, mini_batch_td, mini_batch_adv, mini_batch_rewards
+    def fill_advantages(self, buffer):
+        '''
+        fills in buffer.returns and buffer.advantages from the trajectories in buffer
+        '''
+        S, A, R, lengths = buffer.states, buffer.actions, buffer.rewards, buffer.lengths
+        with self.timer.section("advantages"):
+            # compute advantage (of that action), evaluating the critic over every state in one call
+            values = None
+            if self.use_critic:
+                # an acting pass too, it only provides targets
+                with eval_mode(self.policy), torch.inference_mode():
+                    values = self.policy.value(S.flatten(0, 1)).view(R.shape)
+            adv, critic_target = compute_advantages(R, lengths, self.gamma, values, self.gae_lambda)
+
+            mask = buffer.mask()
+            assert not torch.isnan(A[mask]).any(), "states " + str(S) + " rewards " + str(R)
+            assert not torch.isnan(adv[mask]).any(), str(adv) + "\n" + str(S) + "\n" + str(A)
+
+            # we normalize all of the advantages together, considering over all batches
+            buffer.advantages.zero_()
+            buffer.advantages[mask] = self.normalize_advantages(adv[mask])
+            buffer.returns.copy_(critic_target)
+
+    def update(self, buffer, batch, losses):
+        '''
+        the gradient updates of one batch: num_epochs passes of minibatches over the trajectories in buffer,
+        whose returns, advantages and behaviour log-probs must be filled in
+        batch: index of the batch, for the epsilon and entropy schedules
+        losses: list that the loss terms of every minibatch are appended to
+        '''
+        def calc_eps_decay():
+            return self.ppo_base_epsilon + self.args.weight_func(batch) * self.ppo_dec_epsilon
+
+        # lets do num_epochs passes of minibatches, reshuffled every epoch
+        approx_kl = 0.
+        for epoch in range(self.num_epochs):
+            with self.timer.section("tensor_assembly"):
+                slices = buffer.indices(shuffle=self.args.random_perm)
+            slice_len = len(slices) // self.args.num_mini_batches
+
+            for m in range(0, self.args.num_mini_batches):
+                with self.timer.section("tensor_assembly"):
+                    indices = slices[m*slice_len:(m+1)*slice_len]
+                    state_input, action_input, td_input, adv_input, old_log_prob = buffer.get(indices)
+
+                with self.timer.section("forward_backward"):
+                    # one pass through the policy gives both the action distribution and the value
+                    dist, predicted_value = self.policy.forward_all(state_input)
+
+                    if self.target_kl != None:
+                        # approx KL(behaviour || current) on this minibatch; past target_kl the policy has moved
+                        # far enough, stop without taking this step
+                        with torch.no_grad():
+                            approx_kl = (old_log_prob - dist.log_prob(action_input)).mean().item()
+                        if approx_kl > self.target_kl:
+                            break
+
+                    batch_actor_loss, batch_entropy_loss = self.compute_loss(
+                                            dist=dist,
+                                            action=action_input,
+                                            weights=adv_input,
+                                            ppo_epsilon=calc_eps_decay(),
+                                            old_log_prob=old_log_prob)
+
+                    if self.use_critic:
+                        batch_critic_loss = self.compute_critic_loss(
+                                                predicted=predicted_value,
+                                                value=td_input.unsqueeze(1))
+
+                    batch_entropy_loss = (0.1 + self.args.weight_func(batch))*batch_entropy_loss
+
+                    loss_d = {"actor": batch_actor_loss.item()}
+                    loss = batch_actor_loss
+                    if self.use_critic:
+                        loss += batch_critic_loss
+                        loss_d["critic"] = batch_critic_loss.item()
+                    if self.use_entropy:
+                        loss += batch_entropy_loss
+                        loss_d["entropy"] = batch_entropy_loss.item()
+                    losses.append(loss_d)
+
+                    # every minibatch is a fresh forward pass over stored rollouts, so no graph needs to be retained
+                    self.opt_a.zero_grad()
+                    loss.backward()
+
+                with self.timer.section("optimizer"):
+                    if self.args.gradient_clipping:
+                        torch.nn.utils.clip_grad_norm_(self.parameters(), 0.5)
+
+                    self.opt_a.step()
+
+            if self.target_kl != None and approx_kl > self.target_kl:
+                break
 
     '''
     For 2D Maze nav task:
@@ -154,93 +252,25 @@ class REINFORCE(nn.Module):
         '''
         cumulative_rewards = []
         losses = []
-        if self.ppo:
-            self.old_policy.load_state_dict(copy.deepcopy(self.policy.state_dict()))
+        self.timer = BatchTimer(self.profile, self.timings_path)
+        self.timings = self.timer.records
+
+        buffer = RolloutBuffer(self.args.batch_size, self.args.horizon)
 
         for batch in range(self.args.num_batches):
+            self.timer.start_batch(batch)
 
             if sampler == None:
                 parallel_envs = [env.generate_fresh() for _ in range(self.args.batch_size)]
             else:
                 parallel_envs = [sampler() for _ in range(self.args.batch_size)]
 
-            batch_states = []
-            batch_actions = []
-            batch_td = []
-            batch_adv = []
-            batch_rewards = []
-
-            for rank in range(self.args.batch_size):
-                env, s, a, td, adv, r = self.__step(parallel_envs[rank], self.args.horizon)
-                batch_states.extend(s)
-                batch_actions.extend(a)
-                batch_td.extend(td)
-                batch_adv.extend(adv)
-                batch_rewards.extend(r)
-
-            # we normalize all of the advantages together, considering over all batches
-            # pre_norm = copy.deepcopy(batch_adv)
-            assert np.sum(np.isnan(np.array(batch_adv))) == 0, str(batch_adv) + "\n" + str(batch_states) +"\n" + str(batch_actions)
-            batch_adv = self.normalize_advantages(batch_adv)
-            cumulative_rewards.append(sum(batch_rewards)/self.args.batch_size)
-
-            if self.ppo:
-                # we make a copy of the current policy to use as the "old" policy in the next iteration
-                temp_state_dict = copy.deepcopy(self.policy.state_dict())
+            self.__step(parallel_envs, buffer)
+            cumulative_rewards.append(buffer.rewards.sum().item()/self.args.batch_size)
 
-            if self.args.random_perm:
-                slices = torch.randperm(len(batch_states))
-            else:
-                slices = torch.range(0, len(batch_states) - 1)
-
-            def calc_eps_decay():
-                return self.ppo_base_epsilon + self.args.weight_func(batch) * self.ppo_dec_epsilon
-
-            # lets do minibatches
-            slice_len = len(batch_states) // self.args.num_mini_batches
-            for m in range(0, self.args.num_mini_batches):
-                indices = slices[m*slice_len:(m+1)*slice_len]
-                
-                state_input = torch.as_tensor(batch_states, dtype=torch.float32)[indices]
-                state_input = torch.squeeze(state_input, 1)
-                batch_actor_loss, batch_entropy_loss = self.compute_loss(
-                                        state=state_input,
-                                        action=torch.as_tensor(batch_actions, dtype=torch.float32)[indices],
-                                        weights=torch.as_tensor(batch_adv, dtype=torch.float32)[indices],
-                                        ppo_epsilon=calc_eps_decay())
-                
-                if self.use_critic:
-                    batch_critic_loss = self.compute_critic_loss(
-                                            state=state_input,
-                                            value=torch.as_tensor(batch_td, dtype=torch.float32).unsqueeze(1)[indices])
-                
-                batch_actor_loss = batch_actor_loss
-                batch_entropy_loss = (0.1 + self.args.weight_func(batch))*batch_entropy_loss
-
-                loss_d = {"actor": batch_actor_loss.item()}
-                loss = batch_actor_loss
-                if self.use_critic:
-                    loss += batch_critic_loss
-                    loss_d["critic"] = batch_critic_loss.item()
-                if self.use_entropy:
-                    loss += batch_entropy_loss
-                    loss_d["entropy"] = batch_entropy_loss.item()
-                losses.append(loss_d)
-
-                self.opt_a.zero_grad()
-                if m != self.args.num_mini_batches - 1:
-                    loss.backward(retain_graph=True)
-                else:
-                    loss.backward()
+            self.update(buffer, batch, losses)
 
-                if self.args.gradient_clipping:
-                    torch.nn.utils.clip_grad_norm_(self.parameters(), 0.5)
-                
-                self.opt_a.step()
-            
-            if self.ppo:
-                # update old policy to the previous new policy
-                self.old_policy.load_state_dict(temp_state_dict)
+            self.timer.end_batch(steps=len(buffer), reward=cumulative_rewards[-1])
 
             if batch % 10 == 0:
                 print(cumulative_rewards[-1])
@@ -0,0 +1,124 @@
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from reinforce import REINFORCE
+from utils import seed_worker
+from utils_training import update_init_params_flat
+
+# per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def adapt(model, init_params, task):
+    '''
+    Inner loop of REPTILE: trains model on task starting from the flat parameters init_params.
+
+    The policy's parameter tensors and the optimizer's state buffers are reused across tasks, so no
+    state_dict copies or fresh Adam state are made per task.
+    ret: 1-D tensor of adapted parameters
+    '''
+    model.set_flat_params(init_params)
+    model.reset_optimizer()
+    model.train(task)
+    return model.get_flat_params()
+
+
+class Reptile:
+    '''
+    Sequential REPTILE meta-training, the loop of the notebooks on flat parameter vectors.
+
+    The adapted parameters of all tasks are gathered in a (num_tasks, P) matrix and folded into the
+    initialization with update_init_params_flat, giving the same result as the per-task
+    init <- init + step_size * (adapted - init) updates of update_init_params.
+    '''
+
+    def __init__(self, model, step_size):
+        '''
+        model: REINFORCE model whose policy holds the meta-learned initialization
+        step_size: interpolation step towards each adapted task's parameters (ALPHA/K in the notebooks)
+        '''
+        self.model = model
+        self.step_size = step_size
+
+    def meta_step(self, tasks):
+        init_params = self.model.get_flat_params()
+        targets = torch.empty(len(tasks), len(init_params))
+        for i, t in enumerate(tasks):
+            targets[i] = adapt(self.model, init_params, t)
+        self.model.set_flat_params(update_init_params_flat(targets, init_params, self.step_size))
+
+    def train(self, sampler, num_meta_iter, num_tasks):
+        '''
+        runs num_meta_iter meta-iterations, each on num_tasks tasks drawn from sampler
+        '''
+        for i in range(num_meta_iter):
+            self.meta_step([sampler() for _ in range(num_tasks)])
+        return self.model
+
+
+def _init_worker(model_args, shared_params):
+    '''
+    builds the worker's own REINFORCE model, its parameters are overwritten from shared_params for every task
+    '''
+    torch.set_num_threads(1)
+    _worker["model"] = REINFORCE(model_args)
+    _worker["params"] = shared_params
+
+
+def _adapt(job):
+    '''
+    job: (index, task), the index of the task in the run seeds its random streams, so results do not depend
+         on which worker a task lands on
+    ret: numpy array, parameters adapted to task minus the shared initial parameters
+    '''
+    index, task = job
+    seed_worker(_worker["model"].args.seed, index)
+    init_params = _worker["params"]
+    return (adapt(_worker["model"], init_params, task) - init_params).numpy()
+
+
+class ParallelReptile(Reptile):
+    '''
+    REPTILE meta-training where the inner-loop adaptation of each sampled task runs in a pool of worker processes.
+
+    The initial parameters live in one shared-memory vector that every worker reads at the start of a task,
+    and workers send back only the change in parameters, so the cost of a meta-iteration scales with
+    the number of cores rather than the number of tasks.
+
+    Workers are forked so that model args holding lambdas (e.g. weight_func) and tasks built by notebook
+    samplers do not need to be picklable by reference. Forking a process that has already started torch/OpenMP
+    threads can hang, so the number of workers is always given explicitly; Reptile runs without any.
+    '''
+
+    def __init__(self, model, step_size, num_workers):
+        '''
+        num_workers: number of worker processes, e.g. os.cpu_count()
+        '''
+        super(ParallelReptile, self).__init__(model, step_size)
+        self.params = model.get_flat_params().clone().share_memory_()
+        self.num_tasks_adapted = 0
+        self.pool = mp.get_context("fork").Pool(num_workers, initializer=_init_worker,
+                                                initargs=(model.args, self.params))
+
+    def meta_step(self, tasks):
+        '''
+        adapts the current initialization to every task in parallel, then folds the results in
+        as the sequential loop does
+        '''
+        self.params.copy_(self.model.get_flat_params())
+
+        jobs = [(self.num_tasks_adapted + i, t) for i, t in enumerate(tasks)]
+        self.num_tasks_adapted += len(tasks)
+        targets = self.params + torch.from_numpy(np.stack(self.pool.map(_adapt, jobs)))
+        self.model.set_flat_params(update_init_params_flat(targets, self.params, self.step_size))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,59 @@
+import torch
+
+
+def valid_mask(lengths, T):
+    '''
+    lengths: (N,) tensor of trajectory lengths
+    ret: (N, T) bool tensor, True for the steps each trajectory actually took
+    '''
+    return torch.arange(T).unsqueeze(0) < lengths.unsqueeze(1)
+
+
+def discounted_returns(rewards, gamma):
+    '''
+    Discounted return G_t = sum_i gamma^i r_{t+i} of every step, computed with one reverse scan over time
+    for the whole batch.
+
+    rewards: (N, T) tensor, zero past the end of each trajectory
+    ret: (N, T) tensor of returns
+    '''
+    returns = torch.zeros_like(rewards)
+    running = torch.zeros_like(rewards[:, 0])
+    for t in reversed(range(rewards.shape[1])):
+        running = rewards[:, t] + gamma * running
+        returns[:, t] = running
+    return returns
+
+
+def gae(rewards, values, lengths, gamma, lam):
+    '''
+    Generalized advantage estimates, GAE(lambda). Like the Monte Carlo returns, the value past the
+    last step of a trajectory is taken to be 0.
+
+    rewards: (N, T) tensor, zero past the end of each trajectory
+    values: (N, T) tensor of critic estimates for each state
+    lengths: (N,) tensor of trajectory lengths
+    ret: (N, T) tensor of advantages, zero past the end of each trajectory
+    '''
+    mask = valid_mask(lengths, rewards.shape[1]).to(rewards.dtype)
+    values = values * mask
+    next_values = torch.cat([values[:, 1:], torch.zeros_like(values[:, :1])], dim=1)
+    deltas = (rewards + gamma * next_values - values) * mask
+    return discounted_returns(deltas, gamma * lam)
+
+
+def compute_advantages(rewards, lengths, gamma, values=None, gae_lambda=None):
+    '''
+    rewards: (N, T) tensor, zero past the end of each trajectory
+    lengths: (N,) tensor of trajectory lengths
+    values: (N, T) tensor of critic estimates, or None to use the raw returns as advantages
+    gae_lambda: if not None (and values are given), use GAE(gae_lambda) advantages
+    ret: advantages (N, T), critic targets (N, T)
+    '''
+    returns = discounted_returns(rewards, gamma)
+    if values is None:
+        return returns, returns
+    if gae_lambda is None:
+        return returns - values, returns
+    adv = gae(rewards, values, lengths, gamma, gae_lambda)
+    return adv, adv + values
@@ -0,0 +1,68 @@
+import torch
+
+from returns import valid_mask
+
+
+class RolloutBuffer:
+    '''
+    Fixed capacity storage for one batch of num_envs trajectories of up to horizon steps.
+
+    Every field is a preallocated contiguous float32 tensor laid out as (num_envs, horizon, ...), which
+    generate_episodes writes into in place. Steps past the end of a trajectory are padding, minibatches
+    are gathered from flattened views of the valid steps only.
+    '''
+
+    def __init__(self, num_envs, horizon):
+        self.num_envs = num_envs
+        self.horizon = horizon
+
+        # states and actions are allocated on the first rollout, once their shapes are known
+        self.states = None
+        self.actions = None
+        self.rewards = torch.zeros(num_envs, horizon)
+        self.returns = torch.zeros(num_envs, horizon)
+        self.advantages = torch.zeros(num_envs, horizon)
+        self.log_probs = torch.zeros(num_envs, horizon)
+        self.lengths = torch.zeros(num_envs, dtype=torch.long)
+
+    def allocate(self, state_shape, action_shape):
+        '''
+        makes sure the state and action storage fits the given per-step shapes, reusing it if it does
+        '''
+        if self.states is None or self.states.shape[2:] != state_shape:
+            self.states = torch.zeros((self.num_envs, self.horizon) + tuple(state_shape))
+        if self.actions is None or self.actions.shape[2:] != action_shape:
+            self.actions = torch.zeros((self.num_envs, self.horizon) + tuple(action_shape))
+
+    def reset(self):
+        self.rewards.zero_()
+        self.lengths.zero_()
+
+    def __len__(self):
+        return int(self.lengths.sum())
+
+    def mask(self):
+        '''
+        ret: (num_envs, horizon) bool tensor, True for steps that were actually taken
+        '''
+        return valid_mask(self.lengths, self.horizon)
+
+    def indices(self, shuffle=False):
+        '''
+        ret: flat indices of all valid steps, in trajectory order or randomly permuted
+        '''
+        idx = self.mask().flatten().nonzero().squeeze(1)
+        if shuffle:
+            idx = idx[torch.randperm(len(idx))]
+        return idx
+
+    def get(self, idx):
+        '''
+        idx: flat indices, as returned by indices()
+        ret: states, actions, returns, advantages, log_probs at those steps
+        '''
+        return (self.states.flatten(0, 1)[idx],
+                self.actions.flatten(0, 1)[idx],
+                self.returns.flatten()[idx],
+                self.advantages.flatten()[idx],
+                self.log_probs.flatten()[idx])
@@ -1,10 +1,11 @@
 import copy
+from collections import OrderedDict
 from random import randint
 from random import random
-import matplotlib.pyplot as plt
-import torch
 import numpy as np
 
+import maze_gen
+
 class MazeArgs():
 
     def __init__(self):
@@ -84,7 +85,7 @@ class Continuous2D:
         input: int
         ret: state (list), reward (int)
         '''
-        actions = np.array(torch.clamp(policy_output, -0.1, 0.1))
+        actions = np.clip(np.asarray(policy_output), -0.1, 0.1)
         self.agent += actions
 
         dist_to_goal = -np.sqrt(np.sum((self.agent - self.goal)**2))
@@ -97,7 +98,25 @@ class Continuous2D:
         return Continuous2D(self.args)
 
 
-class SideScroller:
+class GridGame:
+    '''
+    Methods shared by the screen based games (SideScroller, Gobble, RockOn, NoGobble), which keep the current
+    and previous screen as (rows, cols) float32 arrays.
+    '''
+
+    def get_frames(self, out=None):
+        '''
+        out: optional (2, rows, cols) float32 array to write into
+        ret: (2, rows, cols) float32 array, the current and previous screen, the input of ActorCNN
+        '''
+        if out is None:
+            out = np.empty((2, self.rows, self.cols), dtype=np.float32)
+        out[0] = self.screen
+        out[1] = self.prev_screen
+        return out
+
+
+class SideScroller(GridGame):
     state_size = 6*6
     num_actions = 4
 
@@ -111,7 +130,7 @@ class SideScroller:
         self.agent = np.array([0, self.rows-1]) # bottom left location
         self.agent_velocity = np.array([0, 0])
 
-        self.screen = [[0 for i in range(self.cols)] for i in range(self.rows)]
+        self.screen = np.zeros((self.rows, self.cols), dtype=np.float32)
 
         # populate the screen image, with a 1 for the agent, -1 for blockers, 0 otherwise
         self.screen[self.agent[1]][self.agent[0]] = 1
@@ -119,16 +138,13 @@ class SideScroller:
             self.screen[block[1]][block[0]] = -1
         # self.agent_screen = [[0 for i in range(self.cols)] for i in range(self.rows)]
         self.goal = np.array([self.cols - 1, self.rows - 1])
-        self.prev_screen = copy.deepcopy(self.screen)
+        self.prev_screen = self.screen.copy()
 
     def get_state(self):
         '''
-        ret: image?
+        ret: flat float32 array, screen + 0.5*previous screen
         '''
-        l = []
-        for r, rp in zip(self.screen, self.prev_screen):
-            l += list(np.array(r) + 0.5*np.array(rp))
-        return l
+        return (self.screen + 0.5*self.prev_screen).ravel()
         # return [[self.screen]]
         # return [[list(np.array(self.screen) + 0.5 * np.array(self.prev_screen))]]
 
@@ -137,7 +153,7 @@ class SideScroller:
         input: int
         ret: state (list), reward (int)
         '''
-        self.prev_screen = copy.deepcopy(self.screen)
+        np.copyto(self.prev_screen, self.screen)
         policy_output = policy_output.item()
         x = self.agent[0]
         y = self.agent[1]
@@ -196,7 +212,7 @@ class SideScroller:
         print(np.array(self.screen))
 
 
-class Gobble:
+class Gobble(GridGame):
     state_size = 6*6
     num_actions = 4
 
@@ -211,24 +227,21 @@ class Gobble:
         self.agent = np.array([0, self.rows-1]) # bottom left location
         # self.agent_velocity = np.array([0, 0])
 
-        self.screen = [[0 for i in range(self.cols)] for i in range(self.rows)]
+        self.screen = np.zeros((self.rows, self.cols), dtype=np.float32)
 
         # populate the screen image, with a 1 for the agent, -1 for blockers, 0 otherwise
         self.screen[self.agent[1]][self.agent[0]] = 1
         for target in self.targets:
             self.screen[target[1]][target[0]] = -1
         
-        self.prev_screen = copy.deepcopy(self.screen)
+        self.prev_screen = self.screen.copy()
         # self.goal = np.array([self.cols - 1, self.rows - 1])
 
     def get_state(self):
         '''
-        ret: image?
+        ret: flat float32 array, screen + 0.5*previous screen
         '''
-        l = []
-        for r, rp in zip(self.screen, self.prev_screen):
-            l += list(np.array(r) + 0.5*np.array(rp))
-        return l
+        return (self.screen + 0.5*self.prev_screen).ravel()
         # return [[list(np.array(self.screen) + 0.5 * np.array(self.prev_screen))]]
 
     def step(self, policy_output):
@@ -238,7 +251,7 @@ class Gobble:
         '''
         reward_mod = 0
         policy_output = policy_output.item()
-        self.prev_screen = copy.deepcopy(self.screen)
+        np.copyto(self.prev_screen, self.screen)
         # x = self.agent[0]
         # y = self.agent[1]
         # if policy_output == 0 and self.agent[1] == self.rows - 1: # going up with a jump, and not in air currently
@@ -280,7 +293,7 @@ class Gobble:
         print(np.array(self.screen))
 
 
-class RockOn:
+class RockOn(GridGame):
     state_size = 6*6
     num_actions = 4
 
@@ -295,8 +308,12 @@ class RockOn:
         self.agent = np.array([0, self.rows-1]) # bottom left location
         # self.agent_velocity = np.array([0, 0])
 
-        self.screen = [[0 for i in range(self.cols)] for i in range(self.rows)]
-        self.rocks = [[randint(0, self.cols-1), randint(-5,0)] for i in range(args.num_rocks)]
+        self.screen = np.zeros((self.rows, self.cols), dtype=np.float32)
+        if getattr(args, "rocks", None) is not None:
+            # fixed starting rocks, e.g. from a task_pool spec
+            self.rocks = [list(r) for r in args.rocks]
+        else:
+            self.rocks = [[randint(0, self.cols-1), randint(-5,0)] for i in range(args.num_rocks)]
         # self.rock_movs_x = self.args.movs_x
         # self.rock_movs_y = self.args.movs_y
 
@@ -306,18 +323,15 @@ class RockOn:
             if rock[1] >= 0:
                 self.screen[rock[1]][rock[0]] = -1
         
-        self.prev_screen = copy.deepcopy(self.screen)
+        self.prev_screen = self.screen.copy()
         self._t = 0
         # self.goal = np.array([self.cols - 1, self.rows - 1])
 
     def get_state(self):
         '''
-        ret: image?
+        ret: flat float32 array, screen + 0.5*previous screen
         '''
-        l = []
-        for r, rp in zip(self.screen, self.prev_screen):
-            l += list(np.array(r) + 0.5*np.array(rp))
-        return l
+        return (self.screen + 0.5*self.prev_screen).ravel()
         # return [[self.screen, self.agent_screen]]
 
     def step(self, policy_output):
@@ -325,7 +339,7 @@ class RockOn:
         input: int
         ret: state (list), reward (int)
         '''
-        self.prev_screen = copy.deepcopy(self.screen)
+        np.copyto(self.prev_screen, self.screen)
         self._t += 1
         policy_output = policy_output.item()
 
@@ -375,7 +389,7 @@ class RockOn:
     def plot(self):
         print(np.array(self.screen))
 
-class NoGobble:
+class NoGobble(GridGame):
     state_size = 6*6
     num_actions = 4
 
@@ -390,24 +404,21 @@ class NoGobble:
         self.agent = np.array([0, self.rows-1]) # bottom left location
         # self.agent_velocity = np.array([0, 0])
 
-        self.screen = [[0 for i in range(self.cols)] for i in range(self.rows)]
+        self.screen = np.zeros((self.rows, self.cols), dtype=np.float32)
 
         # populate the screen image, with a 1 for the agent, -1 for blockers, 0 otherwise
         self.screen[self.agent[1]][self.agent[0]] = 1
         for target in self.targets:
             self.screen[target[1]][target[0]] = -1
         
-        self.prev_screen = copy.deepcopy(self.screen)
+        self.prev_screen = self.screen.copy()
         # self.goal = np.array([self.cols - 1, self.rows - 1])
 
     def get_state(self):
         '''
-        ret: image?
+        ret: flat float32 array, screen + 0.5*previous screen
         '''
-        l = []
-        for r, rp in zip(self.screen, self.prev_screen):
-            l += list(np.array(r) + 0.5*np.array(rp))
-        return l
+        return (self.screen + 0.5*self.prev_screen).ravel()
         # return [[list(np.array(self.screen) + 0.5 * np.array(self.prev_screen))]]
 
     def step(self, policy_output):
@@ -416,7 +427,7 @@ class NoGobble:
         ret: state (list), reward (int)
         '''
         policy_output = policy_output.item()
-        self.prev_screen = copy.deepcopy(self.screen)
+        np.copyto(self.prev_screen, self.screen)
         # x = self.agent[0]
         # y = self.agent[1]
         # if policy_output == 0 and self.agent[1] == self.rows - 1: # going up with a jump, and not in air currently
@@ -458,13 +469,67 @@ class NoGobble:
         print(np.array(self.screen))
 
 
+class ArrayCache:
+    '''
+    Cache of numpy arrays that evicts the least recently used entries once the arrays, plus any bytes in their
+    keys, take up more than max_bytes. The newest entry is always kept.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __size(self, key, value):
+        return value.nbytes + sum(len(k) for k in key if isinstance(k, bytes))
+
+    def get(self, key, build):
+        '''
+        key: hashable tuple
+        build: function making the array of key on a miss
+        ret: the array of key
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = build()
+        self.entries[key] = value
+        self.nbytes += self.__size(key, value)
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            old_key, old_value = self.entries.popitem(last=False)
+            self.nbytes -= self.__size(old_key, old_value)
+        return value
+
+
 class MazeSimulator:
-    def __init__(self, goal_X, goal_Y, reward_type, state_rep, maze = None, wall_penalty=0, normalize_state=True):
-        
-        self.maze = []
+    # observation tables, keyed by wall layout and state representation. Envs hold on to their own table, the
+    # cache only spares rebuilding it for new envs of a recently seen layout
+    _obs_tables = ArrayCache(256 * 2**20)
+    # shortest path distances to the goal, keyed by wall layout and goal
+    _distance_fields = ArrayCache(64 * 2**20)
+
+    # largest board (rows*cols) with a "fullboard" table, above this use the "index" state_rep
+    max_fullboard_cells = 64 * 64
+
+    def __init__(self, goal_X, goal_Y, reward_type, state_rep, maze = None, wall_penalty=0, normalize_state=True,
+                 num_row=16, num_col=9):
+        '''
+        maze: list of rows of "W"/" " characters, or a (rows, cols) bool wall grid such as those from maze_gen,
+              or None for an open num_row x num_col room. The board size is taken from the maze when one is given.
+        '''
+        # (num_row, num_col) bool array, True where there is a wall. Grids are kept as given (and shared with
+        # the caller and other envs of the layout), never written to
+        if maze is None:
+            self.walls = maze_gen.open_room(num_row, num_col)
+        elif isinstance(maze, np.ndarray):
+            self.walls = maze.astype(bool, copy=False)
+        else:
+            self.walls = np.array(maze) == "W"
 
-        self.num_row = 16
-        self.num_col = 9
+        self.num_row, self.num_col = self.walls.shape
 
         self.agent_x = 1
         self.agent_y = 1
@@ -481,7 +546,8 @@ class MazeSimulator:
         self.state_rep = state_rep
         self.state_rep_func = {"onehot": self.__get_state_onehot_xy,
                         "fullboard": self.__get_state_fullboard_xy,
-                        "xy": self.__get_state_xy}[self.state_rep]
+                        "xy": self.__get_state_xy,
+                        "index": self.__get_state_index_xy}[self.state_rep]
 
         self.initial_x = self.agent_x
         self.initial_y = self.agent_y
@@ -490,66 +556,91 @@ class MazeSimulator:
 
         self.num_actions = len(self.action_space)
         if self.state_rep == "fullboard":
+            if self.num_row * self.num_col > MazeSimulator.max_fullboard_cells:
+                raise ValueError("a " + str(self.num_row) + "x" + str(self.num_col) + " board is too large for "
+                                 "the fullboard state_rep, use state_rep=\"index\" with ActorIndex instead")
             self.state_size = self.num_row * self.num_col
         elif self.state_rep == "onehot":
             self.state_size = self.num_row + self.num_col
         elif self.state_rep == "xy":
             self.state_size = 2
+        elif self.state_rep == "index":
+            self.state_size = 1
         
         self.state_size += 4
-        
-        if maze == None:
-            self.maze = [["W", "W", "W", "W", "W", "W", "W", "W", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", " ", " ", " ", " ", " ", " ", " ", "W"],
-                        ["W", "W", "W", "W", "W", "W", "W", "W", "W"]]
+
+        # width of the input the actor's first layer expects, for "index" that of the equivalent fullboard state
+        if self.state_rep == "index":
+            self.input_size = self.num_row * self.num_col + 4
         else:
-            self.maze = maze
+            self.input_size = self.state_size
 
         self.goal_x = goal_X
         self.goal_y = goal_Y
+        if self.walls[self.goal_y, self.goal_x]:
+            # the goal square is always open, as when it was written into the layout as 'G'
+            self.walls = self.walls.copy()
+            self.walls[self.goal_y, self.goal_x] = False
+
 
-        self.maze[self.goal_y][self.goal_x] = 'G'
-
-        # generates an information vector for each square
-        self.maze_info = [[[] for c in range(self.num_col)] for r in range(self.num_row)]
-        # print(self.maze_info)
-        for x in range(1, self.num_col-1):
-            for y in range(1, self.num_row-1):
-                '''
-                We don't actually do anything with this wall information yet
-                '''
-                # check if a wall is in each direction
-                walls = [0, 0, 0, 0]
-                if self.maze[y + 1][x] == "W":
-                    walls[0] = 1
-                if self.maze[y - 1][x] == "W":
-                    walls[1] = 1
-                if self.maze[y][x + 1] == "W":
-                    walls[2] = 1
-                if self.maze[y][x - 1] == "W":
-                    walls[3] = 1
-                
-                self.maze_info[y][x] = self.state_rep_func(x, y) + walls
+        # the information vector of every square, shared by all copies of this layout/state_rep
+        self.obs_table = self.__get_obs_table()
+
+        # "geodesic" rewards are minus the shortest path length to the goal, which takes walls into account
+        self.distance = None
+        if self.reward == "geodesic":
+            self.distance = self.distance_field()
+            if self.distance[self.initial_y, self.initial_x] < 0:
+                raise ValueError("the goal cannot be reached from the start square")
+
+    def distance_field(self):
+        '''
+        ret: (num_row, num_col) int array of shortest path lengths to the goal, -1 where it cannot be reached.
+             Geodesic envs and their generate_fresh copies keep theirs, other envs share recently computed
+             fields through a bounded cache
+        '''
+        if self.distance is not None:
+            return self.distance
+        key = (self.walls.shape, self.walls.tobytes(), self.goal_x, self.goal_y)
+        return MazeSimulator._distance_fields.get(
+            key, lambda: maze_gen.distance_field(self.walls, self.goal_x, self.goal_y))
+
+    def optimal_path_length(self):
+        '''
+        ret: fewest steps from the start square to the goal, -1 if it cannot be reached
+        '''
+        return int(self.distance_field()[self.initial_y, self.initial_x])
+
+    def __get_obs_table(self):
+        '''
+        ret: (num_row*num_col, state_size) float32 array, row y*num_col + x is the state of square (x, y)
+        '''
+        key = (self.walls.shape, self.walls.tobytes(), self.state_rep, self.normalize_state)
+        return MazeSimulator._obs_tables.get(key, self.__build_obs_table)
+
+    def __build_obs_table(self):
+        ys, xs = np.mgrid[1:self.num_row-1, 1:self.num_col-1]
+        xs, ys = xs.ravel(), ys.ravel()
+
+        # check if a wall is in each direction
+        walls = np.stack([self.walls[ys + 1, xs],
+                          self.walls[ys - 1, xs],
+                          self.walls[ys, xs + 1],
+                          self.walls[ys, xs - 1]], axis=1)
+
+        table = np.zeros((self.num_row * self.num_col, self.state_size), dtype=np.float32)
+        table[ys*self.num_col + xs, :-4] = self.state_rep_func(xs, ys)
+        table[ys*self.num_col + xs, -4:] = walls
+        return table
 
     def __get_action(self, policy_output):
         return self.action_space[policy_output.item()]
 
     def generate_fresh(self):
-        # self.reset_soft()
-        return MazeSimulator(self.goal_x, self.goal_y, self.reward, self.state_rep, self.maze, self.wall_penalty, self.normalize_state)
+        # the maze, walls and lookup tables are never modified after __init__, so a fresh copy can share them
+        fresh = copy.copy(self)
+        fresh.reset_soft()
+        return fresh
 
     def reset_soft(self):
         '''
@@ -558,6 +649,18 @@ class MazeSimulator:
         self.agent_x = self.initial_x
         self.agent_y = self.initial_y
 
+    @property
+    def maze(self):
+        '''
+        the layout as a list of rows of "W", " " and "G" (the goal) characters
+        '''
+        rows = maze_gen.to_rows(self.walls)
+        rows[self.goal_y][self.goal_x] = 'G'
+        return rows
+
+    def at_goal(self):
+        return self.agent_x == self.goal_x and self.agent_y == self.goal_y
+
     def __str__(self):
         s = ""
         for r in self.maze:
@@ -581,65 +684,82 @@ class MazeSimulator:
 
         penalty = 0
         # revert action if unsuccessful
-        if self.maze[self.agent_y][self.agent_x] == 'W':
+        if self.walls[self.agent_y, self.agent_x]:
             self.agent_x -= delta[action][0]
             self.agent_y -= delta[action][1]
             penalty = self.wall_penalty
 
-        if self.maze[self.agent_y][self.agent_x] == 'G':
+        if self.at_goal():
             return self.get_state(), 0
         else:
             if self.reward == "distance":
                 return self.get_state(), penalty-((self.agent_x - self.goal_x)**2 + (self.agent_y - self.goal_y)**2)**(1/2)
             elif self.reward == "constant":
                 return self.get_state(), penalty-1
+            elif self.reward == "geodesic":
+                return self.get_state(), penalty-float(self.distance[self.agent_y, self.agent_x])
 
     def get_state(self):
         '''
         returns the maze info vector corresponding to the agent's current x, y position
         '''
-        if self.maze[self.agent_y][self.agent_x] == 'G':
+        if self.at_goal():
             return None
         else:
-            return self.maze_info[self.agent_y][self.agent_x]
+            return self.obs_table[self.get_state_index()]
+
+    def get_state_index(self):
+        '''
+        returns the row of obs_table holding the agent's current state
+        '''
+        return self.agent_y*self.num_col + self.agent_x
 
     def __get_state_xy(self, x, y):
         '''
-        returns the maze info vector corresponding to the agent's current x, y position
+        x, y: int arrays of square coordinates
+        ret: (len(x), 2) array, the (optionally normalized) coordinates
         '''
         if self.normalize_state:
-            return [(x - self.mean_x) / self.std_dev_x, (y - self.mean_y) / self.std_dev_y]
+            return np.stack([(x - self.mean_x) / self.std_dev_x, (y - self.mean_y) / self.std_dev_y], axis=1)
         else:
-            return [x, y]
+            return np.stack([x, y], axis=1)
 
     def __get_state_onehot_xy(self, x, y):
-        l = [0] * (self.num_row + self.num_col)
-        l[x] = 1
-        l[y + self.num_col] = 1
+        l = np.zeros((len(x), self.num_row + self.num_col), dtype=np.float32)
+        l[np.arange(len(x)), x] = 1
+        l[np.arange(len(x)), y + self.num_col] = 1
         return l
 
     def __get_state_fullboard_xy(self, x, y):
-        l = [0] * (self.num_row * self.num_col)
-        l[y*self.num_col + x] = 1
-        # l[y + self.num_row] = 1
+        l = np.zeros((len(x), self.num_row * self.num_col), dtype=np.float32)
+        l[np.arange(len(x)), y*self.num_col + x] = 1
         return l
 
+    def __get_state_index_xy(self, x, y):
+        '''
+        the position of the 1 in the fullboard state, for actors that look up their first layer (ActorIndex)
+        '''
+        return (y*self.num_col + x)[:, None]
+
     def visualize(self, policy, title):
         '''
         Visualize a policy's decisions in a heatmap fashion
         '''
+        # plotting and the policy need torch and matplotlib, which simulating alone does not
+        import matplotlib.pyplot as plt
+        import torch
 
         heatmap = [[0 for c in range(3*self.num_col)] for r in range(3*self.num_row)]
         offsets = {0: (1, 0), 1: (1, 2), 2: (2, 1), 3: (0, 1)} # x, y offsets for heatmap
         for y in range(1, self.num_row-1):
             for x in range(1, self.num_col-1):
-                if self.maze[y][x] != "W":                    
+                if not self.walls[y, x]:
                     heatmap[3*y + 1][3*x + 1] = 0.5
 
                     upper_left = (x * 3, y * 3) # in x, y
 
                     # get action probs at this state
-                    action_probs = policy(torch.as_tensor(self.maze_info[y][x], dtype=torch.float32))
+                    action_probs = policy(torch.as_tensor(self.obs_table[y*self.num_col + x]))
                     for a in [0, 1, 2, 3]: # action space
                         x_loc = upper_left[0] + offsets[a][0]
                         y_loc = upper_left[1] + offsets[a][1]
@@ -654,14 +774,16 @@ class MazeSimulator:
         '''
         Visualize the value of each state
         '''
+        import matplotlib.pyplot as plt
+        import torch
 
         heatmap = [[0 for c in range(self.num_col)] for r in range(self.num_row)]
         for y in range(1, self.num_row-1):
             for x in range(1, self.num_col-1):
-                if self.maze[y][x] == "W":
+                if self.walls[y, x]:
                     heatmap[y][x] = 0
                 else:
-                    heatmap[y][x] = critic(torch.as_tensor(self.maze_info[y][x], dtype=torch.float32)).item()
+                    heatmap[y][x] = critic(torch.as_tensor(self.obs_table[y*self.num_col + x])).item()
 
         plt.imshow(np.array(heatmap), cmap='PRGn', interpolation='nearest')
         plt.savefig(title)
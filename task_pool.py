@@ -0,0 +1,209 @@
+'''
+Pre-generated pools of tasks for meta-training.
+
+A task is stored as one record of a structured numpy array (TASK_DTYPE) holding everything needed to build
+its environment: the game, board size, targets/blockers/rocks, goals and maze layout seed. Pools are generated
+once, optionally straight into a .npy file that later runs (or worker processes) open memory-mapped, and
+samplers then only draw indices and build environments from the records.
+'''
+import numpy as np
+
+import maze_gen
+from sim import ArrayCache, MazeArgs, Gobble, NoGobble, SideScroller, RockOn, MazeSimulator, Continuous2D
+
+GAMES = ["gobble", "no_gobble", "scroller", "rock", "maze", "continuous"]
+MAZE_KINDS = list(maze_gen.GENERATORS)
+REWARD_TYPES = ["distance", "constant", "geodesic"]
+
+# targets (gobble, no_gobble), blockers (scroller) or rocks (rock) of a task
+MAX_POINTS = 4
+
+TASK_DTYPE = np.dtype([("game", np.uint8),
+                       ("rows", np.uint16),
+                       ("cols", np.uint16),
+                       ("num_points", np.uint8),
+                       ("points", np.int16, (MAX_POINTS, 2)), # x, y
+                       ("goal", np.float32, (2,)),            # x, y
+                       ("agent", np.float32, (2,)),           # x, y (continuous)
+                       ("maze_kind", np.uint8),
+                       ("maze_seed", np.uint32),
+                       ("reward", np.uint8)])
+
+
+# wall grids of recently used maze layouts, and the squares a goal can be drawn from, keyed by (kind, rows, cols, seed)
+_layouts = ArrayCache(64 * 2**20)
+_goal_squares = ArrayCache(64 * 2**20)
+
+
+def _maze_layout(kind, rows, cols, seed):
+    '''
+    ret: the wall grid of a maze task, regenerated if it has been evicted from the cache
+    '''
+    return _layouts.get((kind, rows, cols, seed), lambda: maze_gen.generate(MAZE_KINDS[kind], rows, cols, seed))
+
+
+def _reachable_goals(kind, rows, cols, seed):
+    '''
+    ret: (n, 2) x, y array of the open squares of a layout that can be reached from the start (1, 1), but the start
+    '''
+    def build():
+        grid = _maze_layout(kind, rows, cols, seed)
+        squares = maze_gen.open_squares(grid)
+        reachable = maze_gen.distance_field(grid, 1, 1)[squares[:, 1], squares[:, 0]] > 0
+        return squares[reachable]
+
+    return _goal_squares.get((kind, rows, cols, seed), build)
+
+
+def _fill_grid_game(spec, game, rng):
+    '''
+    draws the targets/blockers/rocks of a 6x6 game exactly as the notebook samplers do
+    '''
+    spec["rows"], spec["cols"] = 6, 6
+    if game in ("gobble", "no_gobble"):
+        points = [[rng.integers(0, 6), rng.integers(0, 6)] for i in range(rng.integers(1, 3))]
+    elif game == "scroller":
+        points = []
+        for i in range(2):
+            x_loc = rng.integers(1, 5)
+            wall_type = rng.integers(0, 4)
+            if wall_type == 0:
+                points.append([x_loc, 5])
+                points.append([x_loc, 4])
+            elif wall_type == 1:
+                points.append([x_loc, 5])
+            elif wall_type == 2:
+                points.append([x_loc, 4])
+    elif game == "rock":
+        points = [[rng.integers(0, 6), rng.integers(-5, 1)] for i in range(2)]
+    spec["num_points"] = len(points)
+    spec["points"][:len(points)] = np.array(points).reshape(-1, 2)
+
+
+def generate_specs(num_tasks, games=("gobble", "no_gobble", "scroller"), seed=None, path=None,
+                   maze_size=(16, 9), maze_kind="open", maze_layouts=1, reward_type="distance"):
+    '''
+    num_tasks: size of the pool
+    games: games to draw tasks from, uniformly
+    seed: seed of the pool, the same seed always gives the same pool
+    path: if given, the pool is written to this .npy file as it is generated and returned memory-mapped
+    maze_size, maze_kind, maze_layouts: maze tasks are (rows, cols) boards of one of maze_layouts seeded
+                                        maze_gen layouts, with the goal on a random open square reachable
+                                        from the start (layouts where none is are skipped)
+    ret: (num_tasks,) array of TASK_DTYPE
+    '''
+    rng = np.random.default_rng(seed)
+    if path != None:
+        specs = np.lib.format.open_memmap(path, mode="w+", dtype=TASK_DTYPE, shape=(num_tasks,))
+    else:
+        specs = np.zeros(num_tasks, dtype=TASK_DTYPE)
+
+    codes = rng.choice([GAMES.index(g) for g in games], size=num_tasks)
+    specs["game"] = codes
+    enclosed = set()
+    for i in range(num_tasks):
+        game = GAMES[codes[i]]
+        if game == "maze":
+            # the goal is any square reachable from the start, so every reward type (geodesic included) can be
+            # built. Layouts that wall the start in (possible with "random") are redrawn
+            layout_seed = int(rng.integers(maze_layouts))
+            squares = _reachable_goals(MAZE_KINDS.index(maze_kind), maze_size[0], maze_size[1], layout_seed)
+            while len(squares) == 0:
+                enclosed.add(layout_seed)
+                if len(enclosed) == maze_layouts:
+                    raise ValueError("no " + maze_kind + " layout has a square reachable from the start")
+                layout_seed = int(rng.integers(maze_layouts))
+                squares = _reachable_goals(MAZE_KINDS.index(maze_kind), maze_size[0], maze_size[1], layout_seed)
+            specs[i]["rows"], specs[i]["cols"] = maze_size
+            specs[i]["maze_kind"] = MAZE_KINDS.index(maze_kind)
+            specs[i]["maze_seed"] = layout_seed
+            specs[i]["goal"] = squares[rng.integers(len(squares))]
+            specs[i]["reward"] = REWARD_TYPES.index(reward_type)
+        elif game == "continuous":
+            specs[i]["goal"] = rng.uniform(-2, 2, size=2)
+        else:
+            _fill_grid_game(specs[i], game, rng)
+
+    if path != None:
+        specs.flush()
+    return specs
+
+
+def load_specs(path, mmap=True):
+    '''
+    opens a pool written by generate_specs, memory-mapped read-only unless mmap is False
+    '''
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def make_env(spec, state_rep="fullboard"):
+    '''
+    spec: one TASK_DTYPE record
+    state_rep: state representation of maze tasks
+    ret: the task's environment
+    '''
+    game = GAMES[spec["game"]]
+    if game == "maze":
+        grid = _maze_layout(int(spec["maze_kind"]), int(spec["rows"]), int(spec["cols"]), int(spec["maze_seed"]))
+        return MazeSimulator(int(spec["goal"][0]), int(spec["goal"][1]), REWARD_TYPES[spec["reward"]], state_rep, grid)
+
+    args = MazeArgs()
+    if game == "continuous":
+        args.goal = spec["goal"].tolist()
+        args.agent = spec["agent"].tolist()
+        return Continuous2D(args)
+
+    args.rows = int(spec["rows"])
+    args.cols = int(spec["cols"])
+    points = spec["points"][:spec["num_points"]].tolist()
+    if game == "gobble":
+        args.targets = points
+        return Gobble(args)
+    elif game == "no_gobble":
+        args.targets = points
+        return NoGobble(args)
+    elif game == "scroller":
+        args.blockers = points
+        return SideScroller(args)
+    elif game == "rock":
+        args.num_rocks = len(points)
+        args.rocks = points
+        return RockOn(args)
+
+
+class TaskPool:
+    '''
+    Samples environments from a fixed array of task specs. Only indices are drawn at sampling time, so
+    worker processes holding the same pool (or the same memory-mapped file) and seed draw the same tasks.
+    '''
+
+    def __init__(self, specs, seed=None, state_rep="fullboard"):
+        '''
+        specs: array of TASK_DTYPE, from generate_specs or load_specs
+        seed: seed of the index stream
+        state_rep: state representation of maze tasks
+        '''
+        self.specs = specs
+        self.rng = np.random.default_rng(seed)
+        self.state_rep = state_rep
+
+    def __len__(self):
+        return len(self.specs)
+
+    def sample_indices(self, n):
+        '''
+        ret: n task indices drawn uniformly with replacement
+        '''
+        return self.rng.integers(len(self.specs), size=n)
+
+    def make_env(self, i):
+        return make_env(self.specs[i], self.state_rep)
+
+    def sample(self):
+        '''
+        ret: the environment of a randomly drawn task, a drop-in replacement for the notebooks' sample_task
+        '''
+        return self.make_env(self.sample_indices(1)[0])
+
+    def __call__(self):
+        return self.sample()
@@ -1,21 +1,52 @@
 
+import contextlib
 import torch
 import torch.nn as nn
-from torch.autograd import Variable
 import torch.nn.functional as F
 from torch.distributions import Categorical, Independent, Normal
 import logging
-logging.basicConfig(filename='goal_locations.log',level=logging.INFO)
 import math
+import random
 import numpy as np
+from vector_sim import VectorEnv, can_vectorize, make_vector_env
+
+def flatten_parameters(module):
+    '''
+    Moves all of module's parameters into one contiguous 1-D tensor, kept as module.flat_params, and makes
+    each parameter a view of its slice of it. The parameter objects themselves are unchanged, so optimizers
+    and state_dict work as before, while copying or interpolating all parameters is one op on flat_params.
+    Operations that replace parameter storage (copy.deepcopy of the module, .to(), .double()) break the
+    sharing, so call this again on the result.
+    ret: module.flat_params
+    '''
+    params = list(module.parameters())
+    flat = torch.cat([p.detach().reshape(-1) for p in params])
+    offset = 0
+    for p in params:
+        p.data = flat[offset:offset + p.numel()].view_as(p)
+        offset += p.numel()
+    module.flat_params = flat
+    return flat
+
 
 class ActorCNN(nn.Module):
+    # rolled out on the (2, rows, cols) get_frames() observations of the grid games instead of get_state()
+    uses_frames = True
 
     def __init__(self, state_input_size, action_space_size, hidden_size):
+        '''
+        state_input_size: frame shape (2, rows, cols), or rows*cols of a square board such as a game's state_size
+        '''
         super(ActorCNN, self).__init__()
 
         self.input_size = state_input_size
         self.action_space_size = action_space_size
+        if isinstance(state_input_size, int):
+            side = math.isqrt(state_input_size)
+            assert side * side == state_input_size, "give the frame shape (2, rows, cols) of non-square boards"
+            self.frame_shape = (2, side, side)
+        else:
+            self.frame_shape = (2,) + tuple(state_input_size)[-2:]
 
         self.hidden_size = hidden_size
 
@@ -32,7 +63,9 @@ class ActorCNN(nn.Module):
 
         # self.conv1 = torch.nn.Conv2d(1, 10, kernel_size=3, padding=1)
         # self.pool = torch.nn.MaxPool2d(kernel_size=2, stride=2, padding=0)
-        self.input_dim = 48#10 * 5 * 5
+        # size of the conv output of one frame
+        with torch.no_grad():
+            self.input_dim = self.conv_features(torch.zeros((1,) + self.frame_shape)).shape[1]
 
         #4608 input features, 64 output features (see sizing flow below)
         self.fc1_a = torch.nn.Linear(self.input_dim, self.hidden_size)
@@ -46,12 +79,15 @@ class ActorCNN(nn.Module):
         self.softmax = nn.Softmax()
 
         self.fc6_c = nn.Linear(self.hidden_size, 1)
+        flatten_parameters(self)
 
-    def forward(self, x):
+    def conv_features(self, x):
         '''
-        x: input vector describing state
-        return: vector containing probabilities?? of each
+        x: frames, (..., 2, rows, cols) or flattened
+        return: (batch, input_dim) flattened conv output
         '''
+        x = x.reshape((-1,) + self.frame_shape)
+
         #Computes the activation of the first convolution
         #Size changes from (3, 32, 32) to (18, 32, 32)
         x = F.relu(self.conv1(x))
@@ -68,40 +104,46 @@ class ActorCNN(nn.Module):
         #Reshape data to input to the input layer of the neural net
         #Size changes from (18, 16, 16) to (1, 4608)
         #Recall that the -1 infers this dimension from the other given dimension
-        x = x.view(-1, self.input_dim)
+        return x.reshape(x.shape[0], -1)
 
+    def features(self, x):
+        '''
+        x: input describing state, frames as from get_frames()
+        return: hidden features shared by the policy and value heads
+        '''
+        x = self.conv_features(x)
         x = F.relu(self.fc1_a(x))
         x = F.relu(self.fc2_a(x))
         x = F.relu(self.fc3_a(x))
         # x = F.relu(self.fc4_a(x))
         # x = F.relu(self.fc5_a(x))
+        return x
+
+    def distribution(self, x):
+        '''
+        x: hidden features from features()
+        return: action distribution
+        '''
         x = self.fc6_a(x)
         return Categorical(self.softmax(x))
 
-    def value(self, x):
-        #Computes the activation of the first convolution
-        #Size changes from (3, 32, 32) to (18, 32, 32)
-        x = F.relu(self.conv1(x))
-        #Size changes from (18, 32, 32) to (18, 16, 16)
-        # x = self.pool(x)
-        x = self.drop_out(x)
-        # x = F.relu(self.conv2(x))
-        # #Size changes from (18, 32, 32) to (18, 16, 16)
-        # x = self.pool2(x)
-        x = F.relu(self.conv2(x))
-        x = self.drop_out2(x)
+    def forward(self, x):
+        '''
+        x: input vector describing state
+        return: vector containing probabilities?? of each
+        '''
+        return self.distribution(self.features(x))
 
-        #Reshape data to input to the input layer of the neural net
-        #Size changes from (18, 16, 16) to (1, 4608)
-        #Recall that the -1 infers this dimension from the other given dimension
-        x = x.view(-1, self.input_dim)
+    def value(self, x):
+        return self.fc6_c(self.features(x))
 
-        x = F.relu(self.fc1_a(x))
-        x = F.relu(self.fc2_a(x))
-        x = F.relu(self.fc3_a(x))
-        # x = F.relu(self.fc4_a(x))
-        # x = F.relu(self.fc5_a(x))
-        return self.fc6_c(x)
+    def forward_all(self, x):
+        '''
+        runs the shared layers once for both heads
+        return: action distribution, value estimate
+        '''
+        x = self.features(x)
+        return self.distribution(x), self.fc6_c(x)
 
 
 class ActorSmall(nn.Module):
@@ -125,28 +167,67 @@ class ActorSmall(nn.Module):
         self.softmax = nn.Softmax()
 
         self.fc6_c = nn.Linear(self.hidden_size, 1)
+        flatten_parameters(self)
 
-    def forward(self, x):
+    def features(self, x):
         '''
         x: input vector describing state
-        return: vector containing probabilities?? of each
+        return: hidden features shared by the policy and value heads
         '''
-        x = F.relu(self.fc1_a(x))
+        x = F.relu(self.input_layer(x))
         x = F.relu(self.fc2_a(x))
         x = F.relu(self.fc3_a(x))
         x = F.relu(self.fc4_a(x))
         # x = F.relu(self.fc5_a(x))
+        return x
+
+    def input_layer(self, x):
+        return self.fc1_a(x)
+
+    def distribution(self, x):
+        '''
+        x: hidden features from features()
+        return: action distribution
+        '''
         x = self.fc6_a(x)
         return Categorical(self.softmax(x))
 
+    def forward(self, x):
+        '''
+        x: input vector describing state
+        return: vector containing probabilities?? of each
+        '''
+        return self.distribution(self.features(x))
+
     def value(self, x):
-        x = F.relu(self.fc1_a(x))
-        x = F.relu(self.fc2_a(x))
-        x = F.relu(self.fc3_a(x))
-        x = F.relu(self.fc4_a(x))
-        # x = F.relu(self.fc5_a(x))
-        # x = self.fc6_a(x)
-        return self.fc6_c(x)
+        return self.fc6_c(self.features(x))
+
+    def forward_all(self, x):
+        '''
+        runs the shared layers once for both heads
+        return: action distribution, value estimate
+        '''
+        x = self.features(x)
+        return self.distribution(x), self.fc6_c(x)
+
+class ActorIndex(ActorSmall):
+    '''
+    ActorSmall for MazeSimulator's "index" states: [cell index, 4 wall bits] rather than a fullboard one-hot.
+
+    fc1_a keeps the shape of the fullboard actor's nn.Linear(rows*cols + 4, hidden_size), so parameters and
+    outputs are identical to ActorSmall on the fullboard state, but the first layer picks the cell's
+    column of the weight instead of multiplying rows*cols mostly zero inputs.
+    state_input_size: the fullboard width rows*cols + 4, MazeSimulator.input_size
+    '''
+
+    def input_layer(self, x):
+        '''
+        x: (..., 5) tensor of [cell index, wall bits]
+        '''
+        weight = self.fc1_a.weight
+        cell = weight.t()[x[..., 0].long()]
+        return cell + F.linear(x[..., 1:], weight[:, -4:], self.fc1_a.bias)
+
 
 class ActorContinuous(nn.Module):
 
@@ -167,27 +248,117 @@ class ActorContinuous(nn.Module):
         self.scale = nn.Linear(self.hidden_size, self.action_space_size) # variance
 
         self.fc6_c = nn.Linear(self.hidden_size, 1)
+        flatten_parameters(self)
 
-    def forward(self, x):
+    def features(self, x):
         '''
         x: input vector describing state
-        return: vector containing probabilities?? of each
+        return: hidden features shared by the policy and value heads
         '''
         x = F.relu(self.fc1_a(x))
         x = F.relu(self.fc2_a(x))
         x = F.relu(self.fc3_a(x))
         x = F.relu(self.fc4_a(x))
+        return x
 
+    def distribution(self, x):
+        '''
+        x: hidden features from features()
+        return: action distribution
+        '''
         scale = torch.exp(torch.clamp(self.scale(x), min=math.log(1e-6), max=math.log(10)))
         return Independent(Normal(loc=torch.clamp(self.means(x), -1, 1), scale=scale), 1)
 
+    def forward(self, x):
+        '''
+        x: input vector describing state
+        return: vector containing probabilities?? of each
+        '''
+        return self.distribution(self.features(x))
+
     def value(self, x):
-        x = F.relu(self.fc1_a(x))
-        x = F.relu(self.fc2_a(x))
-        x = F.relu(self.fc3_a(x))
-        x = F.relu(self.fc4_a(x))
+        return self.fc6_c(self.features(x))
+
+    def forward_all(self, x):
+        '''
+        runs the shared layers once for both heads
+        return: action distribution, value estimate
+        '''
+        x = self.features(x)
+        return self.distribution(x), self.fc6_c(x)
 
-        return self.fc6_c(x)
+
+@contextlib.contextmanager
+def eval_mode(policy):
+    '''
+    puts policy in eval mode (no dropout) for the duration, then restores its previous mode
+    '''
+    was_training = policy.training
+    policy.eval()
+    try:
+        yield policy
+    finally:
+        policy.train(was_training)
+
+
+def act(policy, state, acting=None):
+    '''
+    Acting forward pass, as opposed to the learning forward passes of REINFORCE.update: samples an action for
+    each state without any autograd tracking.
+    The results are inference tensors, they can be read or copied into other tensors but not modified in place.
+    acting: optional exported acting function of policy (policy_export) to sample with instead
+    ret: actions, their log-probabilities
+    '''
+    with torch.inference_mode():
+        if acting != None:
+            action, log_prob, _ = acting(state)
+            return action, log_prob
+        m = policy(state)
+        action = m.sample()
+        return action, m.log_prob(action)
+
+
+# logger writing goal_locations.log, set up by goal_logger on first use
+_goal_logger = None
+
+
+def goal_logger():
+    '''
+    ret: the logger of goal_locations.log. It has its own file handler and does not propagate to the root
+         logger, so it works the same whether or not anything else configured logging
+    '''
+    global _goal_logger
+    if _goal_logger == None:
+        logger = logging.getLogger("goal_locations")
+        if not logger.handlers:
+            handler = logging.FileHandler('goal_locations.log')
+            handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _goal_logger = logger
+    return _goal_logger
+
+
+def seed_worker(seed, index):
+    '''
+    Seeds torch, numpy and random in a worker process. Forked workers start with the parent's random state, so
+    each gets its own stream from the run's seed (args.seed, None counts as 0) and its index, which repeats
+    from run to run.
+    '''
+    seed = (0 if seed == None else seed) * 1000003 + index
+    torch.manual_seed(seed)
+    np.random.seed(seed % 2**32)
+    random.seed(seed)
+
+
+def log_goal_locations(steps):
+    '''
+    appends the last timestep of each trajectory to goal_locations.log, read back by utils_training.plot_goal_loc
+    '''
+    logger = goal_logger()
+    for i in steps:
+        logger.info(i)
 
 
 def generate_episode(policy, env, T, log=False):
@@ -196,30 +367,133 @@ def generate_episode(policy, env, T, log=False):
            action: list of torch.FloatTensor
            reward: list of floats
     '''
+    # convolutional policies see the (2, rows, cols) frames of the grid games
+    observe = env.get_frames if getattr(policy, "uses_frames", False) else env.get_state
     S, A, R = [], [], []
-    for i in range(0, T):
-        state = Variable(torch.FloatTensor(env.get_state()))
-        m = policy(state)
-        action_idx = m.sample()
-        # action = policy.ACTION_SPACE[action_idx.item()]
-        next_state, reward = env.step(action_idx)
-        # TODO
-
-        S.append(state)
-        A.append(action_idx)
-        R.append(reward)
-
-        if next_state == None:
-            # reached terminal state
-            break
-        else:
-            state = next_state
+    with eval_mode(policy):
+        for i in range(0, T):
+            state = torch.FloatTensor(observe())
+            action_idx, _ = act(policy, state)
+            action_idx = action_idx.clone()
+            # action = policy.ACTION_SPACE[action_idx.item()]
+            next_state, reward = env.step(action_idx)
+            # TODO
+
+            S.append(state)
+            A.append(action_idx)
+            R.append(reward)
+
+            if next_state is None:
+                # reached terminal state
+                break
+            else:
+                state = next_state
     
     # if next_state != None:
     #     R[-1] = 100
     if log:
-        logging.info(i)
-    S.append(torch.FloatTensor(next_state) if next_state != None else None)
+        log_goal_locations([i])
+    S.append(torch.FloatTensor(observe()) if next_state is not None else None)
     return S, A, R
 
 
+def generate_episodes(policy, envs, T, log=False, buffer=None, acting=None):
+    '''
+    Runs one trajectory in each environment in lockstep, with a single forward pass of the policy
+    per timestep over all environments that have not yet terminated.
+
+    envs: list of environments, or a VectorEnv. Lists of a single game that has a vectorized
+          engine are stepped with one call per timestep, anything else is stepped one env at a time.
+    buffer: optional RolloutBuffer of matching size to write the trajectories into instead of new tensors,
+            the log-probability of each sampled action is also recorded in buffer.log_probs
+    acting: optional exported acting function of policy (policy_export.ExportedActing) to sample actions with
+    return states: (N, T, state_size) torch.FloatTensor, zero padded past the end of each trajectory,
+                   (N, T, 2, rows, cols) frames for policies with uses_frames set (ActorCNN)
+           actions: (N, T) or (N, T, action_size) tensor, zero padded
+           rewards: (N, T) torch.FloatTensor, zero padded
+           lengths: (N,) torch.LongTensor, number of steps taken in each trajectory
+    '''
+    if isinstance(envs, VectorEnv):
+        vec_env = envs
+    elif can_vectorize(envs):
+        vec_env = make_vector_env(envs)
+    else:
+        vec_env = None
+
+    # convolutional policies see the (2, rows, cols) frames of the grid games, written straight into obs
+    frames = getattr(policy, "uses_frames", False)
+    if vec_env != None:
+        N = vec_env.num_envs
+        if frames:
+            obs = torch.from_numpy(vec_env.get_frames())
+        else:
+            obs = torch.as_tensor(vec_env.get_state(), dtype=torch.float32)
+    else:
+        N = len(envs)
+        if frames:
+            obs = torch.from_numpy(np.stack([env.get_frames() for env in envs]))
+        else:
+            obs = torch.stack([torch.as_tensor(env.get_state(), dtype=torch.float32) for env in envs])
+
+    if buffer != None:
+        assert (buffer.num_envs, buffer.horizon) == (N, T), "buffer does not match the number of envs and horizon"
+        buffer.reset()
+        S, R, lengths = None, buffer.rewards, buffer.lengths
+    else:
+        S = torch.zeros((N, T) + obs.shape[1:])
+        R = torch.zeros(N, T)
+        lengths = torch.zeros(N, dtype=torch.long)
+    A = None
+
+    # the policy only acts under eval_mode and act(), every tensor that is kept is allocated and written
+    # outside inference mode
+    with eval_mode(policy):
+        live = torch.arange(N)
+        for t in range(T):
+            state = obs[live]
+            action, log_prob = act(policy, state, acting)
+            if A is None:
+                if buffer != None:
+                    buffer.allocate(obs.shape[1:], action.shape[1:])
+                    S, A = buffer.states, buffer.actions
+                else:
+                    A = torch.zeros((N, T) + action.shape[1:], dtype=action.dtype)
+
+            S[live, t] = state
+            A[live, t] = action.to(A.dtype)
+            if buffer != None:
+                buffer.log_probs[live, t] = log_prob
+            lengths[live] += 1
+
+            if vec_env != None:
+                all_actions = torch.zeros((N,) + action.shape[1:], dtype=action.dtype)
+                all_actions[live] = action
+                next_obs, reward, done = vec_env.step(all_actions)
+                if frames:
+                    vec_env.get_frames(obs.numpy())
+                else:
+                    obs = torch.as_tensor(next_obs, dtype=torch.float32)
+                R[live, t] = torch.as_tensor(reward[live.numpy()], dtype=torch.float32)
+                done = torch.as_tensor(done[live.numpy()])
+            else:
+                done = torch.zeros(len(live), dtype=torch.bool)
+                for j, i in enumerate(live.tolist()):
+                    next_state, reward = envs[i].step(action[j])
+                    R[i, t] = reward
+                    if next_state is None:
+                        done[j] = True
+                    elif frames:
+                        envs[i].get_frames(obs[i].numpy())
+                    else:
+                        obs[i] = torch.as_tensor(next_state, dtype=torch.float32)
+
+            live = live[~done]
+            if len(live) == 0:
+                # every trajectory reached a terminal state
+                break
+
+    if log:
+        log_goal_locations([l - 1 for l in lengths.tolist()])
+    return S, A, R, lengths
+
+
@@ -6,7 +6,10 @@ from collections import OrderedDict
 import numpy as np
 import scipy.stats
 from reinforce import REINFORCE
+from utils import generate_episodes
+from vector_sim import make_vector_env
 import copy
+import torch.multiprocessing as mp
 
 def update_init_params(target, old, step_size = 0.1):
     """Apply one step of gradient descent on the loss function `loss`, with 
@@ -19,6 +22,20 @@ def update_init_params(target, old, step_size = 0.1):
         updated[name_old] = oldp + step_size * (targetp - oldp) # grad ascent so its a plus
     return updated
 
+def update_init_params_flat(targets, old, step_size = 0.1):
+    """
+    Same result as folding update_init_params over the tasks in order, on flat parameters.
+
+    targets: (num_tasks, P) tensor, row i holds the flat parameters adapted to task i
+    old: (P,) tensor of flat initial parameters
+    Task i (of n) ends up weighted by step_size * (1 - step_size)**(n-1-i), so the whole fold is one
+    matrix-vector product over the task matrix.
+    """
+    num_tasks = targets.shape[0]
+    powers = torch.arange(num_tasks - 1, -1, -1, dtype=old.dtype)
+    weights = step_size * (1 - step_size) ** powers
+    return old + weights @ (targets - old)
+
 
 def make_folder(folder):
     if not os.path.exists(folder):
@@ -58,7 +75,7 @@ def plot_goal_loc(folder=None):
     f = open("goal_locations.log", "r+")
     goal_found_at = []
     for x in f:
-        val = int(x[10:])
+        val = int(x.rsplit(":", 1)[-1]) # "INFO:<logger>:<step>"
         goal_found_at.append(val)
     f.truncate(0) # clear the file
     f.close()
@@ -86,16 +103,66 @@ def save_data(rewards, losses, folder):
     with open(data_save_path, 'w') as outfile:
         json.dump(data, outfile)
 
-def compare_parameter_initializations(params_list, model_args, num_test_tasks, sampler):
+# per-process state of an evaluation worker, set up once by _init_eval_worker
+_eval_worker = {}
+
+def _init_eval_worker(params_list, model_args, tasks):
+    torch.set_num_threads(1)
+    _eval_worker["params_list"] = params_list
+    _eval_worker["model_args"] = model_args
+    _eval_worker["tasks"] = tasks
+
+def _evaluate(job):
+    """
+    adapts initialization i to test task j, exactly as a sequential evaluation would
+    """
+    i, j = job
+    model = REINFORCE(_eval_worker["model_args"])
+    model.load_state_dict(copy.deepcopy(_eval_worker["params_list"][i]["pi"]))
+    rewards, losses = model.train(_eval_worker["tasks"][j])
+    return i, j, rewards
+
+def evaluate_initializations(params_list, model_args, tasks, num_workers=1):
+    """
+    Adapts every initialization in params_list to every task, one run after another, or with num_workers > 1
+    spread over a pool of that many forked worker processes, opt-in for the reason given in ParallelReptile.
+
+    Yields (initialization index, task index, reward curve) for each run as soon as it finishes,
+    so results arrive in completion order rather than submission order.
+    """
+    jobs = [(i, j) for i in range(len(params_list)) for j in range(len(tasks))]
+    if num_workers <= 1:
+        _init_eval_worker(params_list, model_args, tasks)
+        for job in jobs:
+            yield _evaluate(job)
+        return
+
+    with mp.get_context("fork").Pool(num_workers, initializer=_init_eval_worker,
+                                     initargs=(params_list, model_args, tasks)) as pool:
+        for result in pool.imap_unordered(_evaluate, jobs):
+            yield result
+
+def compare_parameter_initializations(params_list, model_args, num_test_tasks, sampler, num_workers=1):
     sample_tasks = [sampler() for _ in range(num_test_tasks)]
-    for d in params_list:
-        all_rewards = []
-        for t in sample_tasks:
-            model = REINFORCE(model_args)
-            model.load_state_dict(copy.deepcopy(d["pi"]))
-            rewards, losses = model.train(t)
-            all_rewards.append(rewards)
-        d["rewards"] = np.array(all_rewards)
+    all_rewards = [[None] * num_test_tasks for _ in params_list]
+    for i, j, rewards in evaluate_initializations(params_list, model_args, sample_tasks, num_workers):
+        all_rewards[i][j] = rewards
+    for d, rewards in zip(params_list, all_rewards):
+        d["rewards"] = np.array(rewards)
+
+def optimality_gaps(policy, mazes, T):
+    """
+    Rolls policy out once from the start of each maze and compares the number of steps it took with the
+    shortest path to the goal.
+
+    mazes: MazeSimulators sharing a board size and state_rep
+    ret: (N,) array of steps taken minus the optimal path length, mazes not solved within T steps count T steps
+         (N,) bool array, True where the goal was reached
+    """
+    vec_env = make_vector_env([m.generate_fresh() for m in mazes])
+    _, _, _, lengths = generate_episodes(policy, vec_env, T)
+    optimal = np.array([m.optimal_path_length() for m in mazes])
+    return lengths.numpy() - optimal, vec_env.dones.copy()
 
 def plot_adaptation(params_list):
     for i in range(len(params_list)):
@@ -0,0 +1,405 @@
+import random
+
+import numpy as np
+
+from sim import Gobble, NoGobble, SideScroller, RockOn, MazeSimulator
+
+
+class VectorEnv:
+    '''
+    N instances of one game held as stacked NumPy arrays, advanced together with a single step call.
+
+    Instances that have reached a terminal state are frozen: later steps leave them untouched and
+    give them a reward of 0, so a batch can keep stepping until every instance is done.
+    '''
+    num_actions = 4
+
+    def __init__(self, envs, seed=None):
+        self.envs = list(envs)
+        self.num_envs = len(self.envs)
+        self.seed = seed
+        # without a seed the generator is seeded from the random module, like the games' own draws, so runs
+        # seeded with random.seed repeat exactly
+        self.rng = np.random.default_rng(seed if seed != None else random.getrandbits(64))
+        self.reset()
+
+    def reset(self):
+        '''
+        puts every instance back in the state a generate_fresh() copy of it would start in
+        ret: states (N, state_size)
+        '''
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self._reset()
+        return self.get_state()
+
+    def generate_fresh(self):
+        return type(self)(self.envs, self.seed)
+
+    @staticmethod
+    def stack_key(env):
+        '''
+        ret: the properties instances must share to be stacked into one VectorEnv (board size, ...)
+        '''
+        return ()
+
+    def step(self, actions):
+        '''
+        input: (N,) array (or tensor) of actions, entries for finished instances are ignored
+        ret: states (N, state_size) float32, rewards (N,) float, dones (N,) bool
+        '''
+        actions = np.asarray(actions).reshape(self.num_envs).astype(np.int64)
+        rewards = np.zeros(self.num_envs)
+        live = np.flatnonzero(~self.dones)
+        if len(live) > 0:
+            self._step(live, actions[live], rewards)
+        return self.get_state(), rewards, self.dones.copy()
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _step(self, live, actions, rewards):
+        '''
+        advances the instances indexed by live, writing into rewards and self.dones
+        '''
+        raise NotImplementedError
+
+
+class VectorGridGame(VectorEnv):
+    '''
+    Shared screen handling for the rows x cols grid games, agent positions are stored as (x, y)
+    '''
+    # x, y offsets for the actions of Gobble and NoGobble
+    moves = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
+
+    def __init__(self, envs, seed=None):
+        for env in envs:
+            assert self.stack_key(env) == self.stack_key(envs[0]), "all instances must share a board size"
+        self.rows = envs[0].rows
+        self.cols = envs[0].cols
+        self.state_size = self.rows * self.cols
+        super(VectorGridGame, self).__init__(envs, seed)
+
+    @staticmethod
+    def stack_key(env):
+        return (env.rows, env.cols)
+
+    def _reset_screen(self):
+        self.screen = np.zeros((self.num_envs, self.rows, self.cols), dtype=np.float32)
+        self.prev_screen = np.zeros_like(self.screen)
+        self.agent = np.tile(np.array([0, self.rows - 1]), (self.num_envs, 1))
+
+    def _cell_mask(self, cells_per_env):
+        '''
+        input: list of N lists of [x, y] cells
+        ret: (N, rows, cols) bool array with those cells set
+        '''
+        mask = np.zeros((self.num_envs, self.rows, self.cols), dtype=bool)
+        for i, cells in enumerate(cells_per_env):
+            for c in cells:
+                mask[i, c[1], c[0]] = True
+        return mask
+
+    def _move_agent(self, live, actions):
+        '''
+        moves and clips the live agents by the action table
+        ret: old positions, new positions (both (len(live), 2))
+        '''
+        old = self.agent[live]
+        pos = old + self.moves[actions]
+        pos[:, 0] = np.clip(pos[:, 0], 0, self.cols - 1)
+        pos[:, 1] = np.clip(pos[:, 1], 0, self.rows - 1)
+        self.agent[live] = pos
+        return old, pos
+
+    def _redraw_agent(self, live, old, pos):
+        self.screen[live, old[:, 1], old[:, 0]] = 0
+        self.screen[live, pos[:, 1], pos[:, 0]] = 1
+
+    def get_state(self):
+        '''
+        ret: (N, rows*cols) float32, screen + 0.5*previous screen for every instance
+        '''
+        return (self.screen + 0.5 * self.prev_screen).reshape(self.num_envs, -1)
+
+    def get_frames(self, out=None):
+        '''
+        out: optional (N, 2, rows, cols) float32 array to write into, e.g. the numpy view of a batch tensor
+        ret: (N, 2, rows, cols) float32, the current and previous screen of every instance
+        '''
+        if out is None:
+            out = np.empty((self.num_envs, 2, self.rows, self.cols), dtype=np.float32)
+        out[:, 0] = self.screen
+        out[:, 1] = self.prev_screen
+        return out
+
+
+class VectorGobble(VectorGridGame):
+
+    def _reset(self):
+        self._reset_screen()
+        self.targets = self._cell_mask([env.args.targets for env in self.envs])
+        self.screen[np.arange(self.num_envs), self.agent[:, 1], self.agent[:, 0]] = 1
+        self.screen[self.targets] = -1
+        self.prev_screen[:] = self.screen
+
+    def _step(self, live, actions, rewards):
+        self.prev_screen[live] = self.screen[live]
+        old, pos = self._move_agent(live, actions)
+
+        hit = self.targets[live, pos[:, 1], pos[:, 0]]
+        self.targets[live, pos[:, 1], pos[:, 0]] = False
+        self._redraw_agent(live, old, pos)
+
+        remaining = self.targets[live].any(axis=(1, 2))
+        rewards[live] = 10 * hit - remaining
+        self.dones[live] = ~remaining
+
+
+class VectorNoGobble(VectorGridGame):
+
+    def _reset(self):
+        self._reset_screen()
+        self.targets = self._cell_mask([env.args.targets for env in self.envs])
+        self.screen[np.arange(self.num_envs), self.agent[:, 1], self.agent[:, 0]] = 1
+        self.screen[self.targets] = -1
+        self.prev_screen[:] = self.screen
+
+    def _step(self, live, actions, rewards):
+        self.prev_screen[live] = self.screen[live]
+        old, pos = self._move_agent(live, actions)
+
+        hit = self.targets[live, pos[:, 1], pos[:, 0]]
+        safe = ~hit
+        self._redraw_agent(live[safe], old[safe], pos[safe])
+
+        rewards[live] = np.where(hit, -100, 1)
+        self.dones[live] = hit
+
+
+class VectorSideScroller(VectorGridGame):
+
+    def _reset(self):
+        self._reset_screen()
+        self.velocity = np.zeros((self.num_envs, 2), dtype=np.int64)
+        self.blockers = self._cell_mask([env.args.blockers for env in self.envs])
+        self.screen[np.arange(self.num_envs), self.agent[:, 1], self.agent[:, 0]] = 1
+        self.screen[self.blockers] = -1
+        self.prev_screen[:] = self.screen
+        self.goal = np.array([self.cols - 1, self.rows - 1])
+
+    def _is_blocked(self, live, x, y):
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        blocked = np.zeros(len(live), dtype=bool)
+        blocked[inside] = self.blockers[live[inside], y[inside], x[inside]]
+        return blocked
+
+    def _slide(self, live, axis, x, y, vel):
+        '''
+        moves one cell at a time along axis for |vel| cells (at most 2), stopping at the first blocker
+        '''
+        steps = np.abs(vel)
+        direction = np.sign(vel)
+        moving = np.ones(len(live), dtype=bool)
+        for k in range(2):
+            moving &= steps > k
+            nx = x + direction * (axis == 0)
+            ny = y + direction * (axis == 1)
+            blocked = moving & self._is_blocked(live, nx, ny)
+            advance = moving & ~blocked
+            x = np.where(advance, nx, x)
+            y = np.where(advance, ny, y)
+            vel = np.where(blocked, 0, vel)
+            moving &= ~blocked
+        return x, y, vel
+
+    def _step(self, live, actions, rewards):
+        self.prev_screen[live] = self.screen[live]
+        old = self.agent[live]
+        vel = self.velocity[live]
+
+        jump = (actions == 0) & (old[:, 1] == self.rows - 1)
+        vel[jump, 1] = -2
+        vel[actions == 1, 0] = np.minimum(vel[actions == 1, 0] + 1, 2)
+        vel[actions == 2, 0] = np.maximum(vel[actions == 2, 0] - 1, -2)
+
+        x, y = old[:, 0], old[:, 1]
+        x, y, vel[:, 0] = self._slide(live, 0, x, y, vel[:, 0])
+        x, y, vel[:, 1] = self._slide(live, 1, x, y, vel[:, 1])
+
+        pos = np.stack([np.clip(x, 0, self.cols - 1), np.clip(y, 0, self.rows - 1)], axis=1)
+        self.agent[live] = pos
+        self._redraw_agent(live, old, pos)
+
+        # simulate forces of gravity
+        vel[:, 1] = np.where(pos[:, 1] < self.rows - 1, vel[:, 1] + 1, 0)
+        self.velocity[live] = vel
+
+        at_goal = (pos == self.goal).all(axis=1)
+        rewards[live] = np.where(at_goal, 0, -1)
+        self.dones[live] = at_goal
+
+
+class VectorRockOn(VectorGridGame):
+    '''
+    Batched RockOn. Every instance starts (and is reset to) the rocks it drew itself, and rocks that fall off
+    the board respawn from the VectorEnv's generator.
+    '''
+
+    def __init__(self, envs, seed=None):
+        for env in envs:
+            assert self.stack_key(env) == self.stack_key(envs[0]), \
+                "all instances must share a board size and number of rocks"
+        self.num_rocks = len(envs[0].rocks)
+        rocks = np.array([env.rocks for env in envs], dtype=np.int64)
+        self.initial_rocks = rocks.reshape(len(envs), self.num_rocks, 2)
+        super(VectorRockOn, self).__init__(envs, seed)
+
+    @staticmethod
+    def stack_key(env):
+        return (env.rows, env.cols, len(env.rocks))
+
+    def generate_fresh(self):
+        # a fresh RockOn draws new starting rocks, unless its args fix them
+        return type(self)([env.generate_fresh() for env in self.envs], self.seed)
+
+    def _spawn_rocks(self, n):
+        return np.stack([self.rng.integers(0, self.cols, n), self.rng.integers(-5, 1, n)], axis=-1)
+
+    def _reset(self):
+        self._reset_screen()
+        self.t = np.zeros(self.num_envs, dtype=np.int64)
+        self.rocks = self.initial_rocks.copy()
+        on_screen = self.rocks[..., 1] >= 0
+        env_idx = np.repeat(np.arange(self.num_envs)[:, None], self.num_rocks, axis=1)
+        self.screen[env_idx[on_screen], self.rocks[on_screen][:, 1], self.rocks[on_screen][:, 0]] = -1
+        self.prev_screen[:] = self.screen
+
+    def _step(self, live, actions, rewards):
+        self.prev_screen[live] = self.screen[live]
+        self.t[live] += 1
+
+        old = self.agent[live]
+        pos = old.copy()
+        pos[actions == 0, 0] += 1
+        pos[actions == 2, 0] -= 1
+        pos[:, 0] = np.clip(pos[:, 0], 0, self.cols - 1)
+        self.agent[live] = pos
+
+        # rocks are updated one after another so overlapping rocks draw in the same order as RockOn
+        for i in range(self.num_rocks):
+            r_old = self.rocks[live, i]
+            r_new = r_old.copy()
+            r_new[:, 1] += 1
+            respawn = r_new[:, 1] >= self.rows
+            r_new[respawn] = self._spawn_rocks(int(respawn.sum()))
+            draw = ~respawn & (r_new[:, 1] >= 0)
+            self.screen[live[draw], r_new[draw, 1], r_new[draw, 0]] = -1
+            clear = (r_old[:, 1] >= 0) & (r_old[:, 1] < self.rows)
+            self.screen[live[clear], r_old[clear, 1], r_old[clear, 0]] = 0
+            self.rocks[live, i] = r_new
+
+        self._redraw_agent(live, old, pos)
+
+        crushed = (self.rocks[live] == pos[:, None, :]).all(axis=2).any(axis=1)
+        rewards[live] = np.where(crushed, -1000, self.t[live] / 2)
+        self.dones[live] = crushed
+
+
+class VectorMaze(VectorEnv):
+    '''
+    Batched MazeSimulator, each instance may have its own maze, goal and reward type
+    '''
+    # x, y offsets for 'N', 'S', 'E', 'W'
+    moves = np.array([[0, -1], [0, 1], [1, 0], [-1, 0]])
+
+    def __init__(self, envs, seed=None):
+        for env in envs:
+            assert self.stack_key(env) == self.stack_key(envs[0]), \
+                "all instances must share a board size and state representation"
+        self.rows = envs[0].num_row
+        self.cols = envs[0].num_col
+        self.state_size = envs[0].state_size
+
+        self.walls = np.stack([env.walls for env in envs])
+        self.goal = np.array([[env.goal_x, env.goal_y] for env in envs])
+        self.start = np.array([[env.initial_x, env.initial_y] for env in envs])
+        self.distance_reward = np.array([env.reward == "distance" for env in envs])
+        self.geodesic_reward = np.array([env.reward == "geodesic" for env in envs])
+        # shortest path lengths of the "geodesic" instances, unused (zero) for the others
+        self.distance = None
+        if self.geodesic_reward.any():
+            self.distance = np.stack([env.distance if env.distance is not None else np.zeros_like(env.walls, dtype=np.int64)
+                                      for env in envs])
+        self.wall_penalty = np.array([env.wall_penalty for env in envs], dtype=np.float64)
+
+        # observation tables of the distinct mazes, instances of the same maze/goal share one table
+        tables = {}
+        for env in envs:
+            tables.setdefault(id(env.obs_table), env.obs_table)
+        table_ids = list(tables)
+        self.table_idx = np.array([table_ids.index(id(env.obs_table)) for env in envs])
+        self.obs_tables = np.stack(list(tables.values()))
+        super(VectorMaze, self).__init__(envs, seed)
+
+    @staticmethod
+    def stack_key(env):
+        return (env.num_row, env.num_col, env.state_rep, env.state_size)
+
+    def _reset(self):
+        self.agent = self.start.copy()
+
+    def get_state(self):
+        '''
+        ret: (N, state_size) float32, the maze info vector of each agent's cell
+        '''
+        cells = self.agent[:, 1] * self.cols + self.agent[:, 0]
+        return self.obs_tables[self.table_idx, cells]
+
+    def _step(self, live, actions, rewards):
+        old = self.agent[live]
+        pos = old + self.moves[actions]
+
+        # revert moves into walls
+        hit_wall = self.walls[live, pos[:, 1], pos[:, 0]]
+        pos[hit_wall] = old[hit_wall]
+        penalty = np.where(hit_wall, self.wall_penalty[live], 0)
+        self.agent[live] = pos
+
+        goal = self.goal[live]
+        at_goal = (pos == goal).all(axis=1)
+        dist = np.sqrt(((pos - goal)**2).sum(axis=1))
+        reward = np.where(self.distance_reward[live], penalty - dist, penalty - 1)
+        if self.distance is not None:
+            reward = np.where(self.geodesic_reward[live], penalty - self.distance[live, pos[:, 1], pos[:, 0]], reward)
+        rewards[live] = np.where(at_goal, 0, reward)
+        self.dones[live] = at_goal
+
+
+VECTOR_ENVS = {Gobble: VectorGobble,
+               NoGobble: VectorNoGobble,
+               SideScroller: VectorSideScroller,
+               RockOn: VectorRockOn,
+               MazeSimulator: VectorMaze}
+
+
+def can_vectorize(envs):
+    '''
+    True if envs is a non-empty list of instances of one game that has a vectorized engine, which can be stacked
+    (same board size, state size, number of rocks, ...)
+    '''
+    if len(envs) == 0 or type(envs[0]) not in VECTOR_ENVS or any(type(e) is not type(envs[0]) for e in envs):
+        return False
+    stack_key = VECTOR_ENVS[type(envs[0])].stack_key
+    key = stack_key(envs[0])
+    return all(stack_key(e) == key for e in envs)
+
+
+def make_vector_env(envs, seed=None):
+    '''
+    input: list of instances of a single game (e.g. from generate_fresh() or a task sampler)
+    ret: the matching VectorEnv holding all of them
+    '''
+    if not can_vectorize(envs):
+        raise ValueError("cannot vectorize environments of types " + str(sorted(set(type(e).__name__ for e in envs)))
+                         + ", they must be one game with a shared board size")
+    return VECTOR_ENVS[type(envs[0])](envs, seed)